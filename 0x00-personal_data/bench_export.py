@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the redacted users export against a local SQLite stand-in
+
+Usage:
+    $ ./bench_export.py [rows] [batch_size] [workers ...]
+
+Each worker count is timed with export_users_parallel, 1 worker with the
+serial export_users.
+
+The users table mirrors the columns of user_data.sql.
+"""
+import os
+import sqlite3
+import sys
+import time
+from filtered_logger import export_users, export_users_parallel
+
+
+DB_PATH = "bench_personal_data.db"
+
+
+def create_users(path: str, rows: int) -> None:
+    """
+    Create a SQLite users table with fake rows
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, "
+               "email TEXT, phone TEXT, ssn TEXT, password TEXT, ip TEXT, "
+               "last_login TEXT, user_agent TEXT)")
+    db.executemany(
+        "INSERT INTO users (name, email, phone, ssn, password, ip, "
+        "last_login, user_agent) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (("user{}".format(i), "user{}@example.com".format(i),
+          "(555) 555-{:04d}".format(i % 10000), "000-12-{:04d}".format(i),
+          "hash{}".format(i), "10.0.{}.{}".format(i // 256 % 256, i % 256),
+          "2019-11-14 06:14:24", "Mozilla/5.0") for i in range(rows)))
+    db.commit()
+    db.close()
+
+
+def export(workers: int, batch_size: int) -> int:
+    """
+    Export the stand-in users table to /dev/null
+    """
+    if workers > 1:
+        return export_users_parallel(os.devnull, workers,
+                                     batch_size=batch_size)
+    db = sqlite3.connect(DB_PATH)
+    with open(os.devnull, "w", buffering=1 << 20) as output:
+        count = export_users(db, output, batch_size)
+    db.close()
+    return count
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    workers = [int(arg) for arg in sys.argv[3:]] or [1]
+    os.environ["PERSONAL_DATA_DB_ENGINE"] = "sqlite"
+    os.environ["PERSONAL_DATA_DB_NAME"] = DB_PATH
+    create_users(DB_PATH, rows)
+    for count in workers:
+        start = time.perf_counter()
+        exported = export(count, batch_size)
+        elapsed = time.perf_counter() - start
+        print("{} workers: {} rows in {:.2f}s ({:.0f} rows/s)".format(
+            count, exported, elapsed, exported / elapsed))
+    os.remove(DB_PATH)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of RedactingFormatter, in records/sec
+
+Usage:
+    $ ./bench_redaction.py [records]
+
+Compares the compiled Redactor with the previous implementation that
+rebuilt the pattern and a lambda for every record.
+"""
+import logging
+import re
+import sys
+import time
+from filtered_logger import PII_FIELDS, RedactingFormatter
+
+
+PII_MESSAGE = ("name=Bob;email=bob@dylan.com;phone=(555) 555-5555;"
+               "ssn=000-123-0000;password=bezkjh;ip=60ed:c396:2ff:244;"
+               "last_login=2019-11-14T06:14:24;user_agent=Chrome/58.0;")
+PLAIN_MESSAGE = "GET /api/v1/status 200 in 1.2ms;worker=3;"
+
+
+class LegacyRedactingFormatter(RedactingFormatter):
+    """
+    RedactingFormatter recompiling its pattern for every record
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format a record with the per-call re.sub implementation
+        """
+        pattern = f"({'|'.join(self.fields)})=[^{self.SEPARATOR}]*"
+        record.msg = re.sub(pattern,
+                            lambda m: f"{m.group(1)}={self.REDACTION}",
+                            record.getMessage())
+        return logging.Formatter.format(self, record)
+
+
+def throughput(formatter: logging.Formatter, message: str,
+               records: int) -> float:
+    """
+    Return the number of records formatted per second
+    """
+    batch = [logging.LogRecord("user_data", logging.INFO, None, None,
+                               message, None, None) for _ in range(records)]
+    start = time.perf_counter()
+    for record in batch:
+        formatter.format(record)
+    return records / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("{:>10} {:>16} {:>16}".format("message", "legacy (rec/s)",
+                                        "compiled (rec/s)"))
+    for name, message in (("pii", PII_MESSAGE), ("plain", PLAIN_MESSAGE)):
+        legacy = throughput(LegacyRedactingFormatter(PII_FIELDS),
+                            message, records)
+        compiled = throughput(RedactingFormatter(PII_FIELDS),
+                              message, records)
+        print("{:>10} {:>16.0f} {:>16.0f}".format(name, legacy, compiled))
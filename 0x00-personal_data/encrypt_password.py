@@ -4,26 +4,35 @@ Defines a hash_password function to return a hashed password
 """
 import bcrypt
 from bcrypt import hashpw
+from password_policy import POLICY
+from typing import Callable
 
 
 def hash_password(password: str) -> bytes:
     """
-    Returns a hashed password
+    Returns a hashed password, with the cost chosen by POLICY
     Args:
         password (str): password to be hashed
     """
     b = password.encode()
-    hashed = hashpw(b, bcrypt.gensalt())
+    hashed = hashpw(b, bcrypt.gensalt(POLICY.rounds()))
     return hashed
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
+def is_valid(hashed_password: bytes, password: str,
+             rehash: Callable[[bytes], None] = None) -> bool:
     """
     Check whether a password is valid
     Args:
         hashed_password (bytes): hashed password
         password (str): password in string
+        rehash (callable): called with a new hash of the password when
+            it is valid but hashed_password has a lower cost than POLICY
     Return:
         bool
     """
-    return bcrypt.checkpw(password.encode(), hashed_password)
+    if not bcrypt.checkpw(password.encode(), hashed_password):
+        return False
+    if rehash is not None and POLICY.needs_rehash(hashed_password):
+        rehash(hash_password(password))
+    return True
@@ -3,14 +3,71 @@
 """
 import re
 import logging
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from logging.handlers import QueueHandler
+from typing import List, Tuple, TextIO
+import argparse
+import atexit
+import copy
 import os
-import mysql.connector
+import queue
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
 
 
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
 
+class Redactor:
+    """ Obfuscates a fixed set of fields, with the regex compiled once
+    """
+
+    def __init__(self, fields: Tuple[str, ...], redaction: str,
+                 separator: str):
+        """
+        Compile the redaction pattern.
+
+        Args:
+            fields (tuple of str): The fields to obfuscate.
+            redaction (str): The string to replace the field values with.
+            separator (str): The character separating the fields.
+        """
+        self.keys = tuple(f"{field}=" for field in fields)
+        names = '|'.join(re.escape(field) for field in fields)
+        self.pattern = re.compile(f"({names})=[^{re.escape(separator)}]*")
+        self.replacement = "\\g<1>=" + redaction.replace("\\", "\\\\")
+
+    def redact(self, message: str) -> str:
+        """
+        Obfuscates the fields in a log message.
+
+        Messages without any "<field>=" are returned as is, without
+        running the regex.
+        """
+        for key in self.keys:
+            if key in message:
+                return self.pattern.sub(self.replacement, message)
+        return message
+
+
+@lru_cache(maxsize=128)
+def get_redactor(fields: Tuple[str, ...], redaction: str,
+                 separator: str) -> Redactor:
+    """
+    Return the Redactor of a (fields, redaction, separator) tuple
+    """
+    return Redactor(fields, redaction, separator)
+
+
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
     """
@@ -25,8 +82,7 @@ def filter_datum(fields: List[str], redaction: str,
     Returns:
         str: The log message with specified fields obfuscated.
     """
-    pattern = f"({'|'.join(fields)})=[^{separator}]*"
-    return re.sub(pattern, lambda m: f"{m.group(1)}={redaction}", message)
+    return get_redactor(tuple(fields), redaction, separator).redact(message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -40,6 +96,8 @@ class RedactingFormatter(logging.Formatter):
     def __init__(self, fields: List[str]):
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.redactor = get_redactor(tuple(fields), self.REDACTION,
+                                     self.SEPARATOR)
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -48,8 +106,8 @@ class RedactingFormatter(logging.Formatter):
 
         This method overrides the base class method to add functionality
         for redacting specified fields in the log message. It uses the
-        filter_datum function to replace sensitive field values with a
-        redaction string before formatting the log record.
+        Redactor compiled for the fields to replace sensitive values
+        with a redaction string before formatting the log record.
 
         Args:
             record (logging.LogRecord): The log record to be formatted.
@@ -58,16 +116,126 @@ class RedactingFormatter(logging.Formatter):
             str: The formatted log record as a string with sensitive
             fields redacted.
         """
-        record.msg = filter_datum(self.fields, self.REDACTION,
-                                  record.getMessage(), self.SEPARATOR)
+        record.msg = self.redactor.redact(record.getMessage())
         return super(RedactingFormatter, self).format(record)
 
 
-def get_logger() -> logging.Logger:
+class BoundedQueueHandler(QueueHandler):
+    """ QueueHandler enqueuing raw records in a bounded queue
+
+    Redaction and I/O are left to the listener thread. When the queue is
+    full, the overflow policy either blocks the caller ("block"), drops
+    the new record ("drop_new") or the oldest queued one ("drop_oldest").
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest")
+
+    def __init__(self, records: queue.Queue, overflow: str = "block"):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        super(BoundedQueueHandler, self).__init__(records)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merge the arguments into the message, without formatting
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Enqueue a record according to the overflow policy
+        """
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == "drop_new":
+                    return
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+
+class BatchQueueListener(threading.Thread):
+    """ Thread formatting queued records with a handler's formatter and
+    writing them to its stream in batches
+    """
+
+    _STOP = object()
+
+    def __init__(self, records: queue.Queue, handler: logging.StreamHandler,
+                 batch_size: int = 256):
+        super(BatchQueueListener, self).__init__(name="user_data-logger",
+                                                 daemon=True)
+        self.records = records
+        self.handler = handler
+        self.batch_size = batch_size
+
+    def run(self) -> None:
+        """
+        Write batches of records until stopped
+        """
+        stopped = False
+        while not stopped:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stopped = self._STOP in batch
+            records = [record for record in batch if record is not self._STOP]
+            # errors are reported like Handler.emit() does, and the
+            # thread keeps draining the queue: callers may block on it
+            lines = []
+            for record in records:
+                try:
+                    lines.append(self.handler.format(record))
+                except Exception:
+                    self.handler.handleError(record)
+            if len(lines) == 0:
+                continue
+            lines.append("")
+            try:
+                with self.handler.lock:
+                    self.handler.stream.write(
+                        self.handler.terminator.join(lines))
+                    self.handler.flush()
+            except Exception:
+                self.handler.handleError(records[0])
+
+    def stop(self) -> None:
+        """
+        Write the queued records and stop the thread
+        """
+        self.records.put(self._STOP)
+        self.join()
+
+
+def get_logger(asynchronous: bool = None) -> logging.Logger:
     """
     Return a logging.Logger object
+
+    Handlers are only attached on the first call. In asynchronous mode
+    (default: PERSONAL_DATA_LOG_ASYNC), the caller only enqueues records
+    in a queue of PERSONAL_DATA_LOG_QUEUE_SIZE records, with the overflow
+    policy PERSONAL_DATA_LOG_OVERFLOW; a listener thread redacts and
+    writes them.
     """
     logger = logging.getLogger("user_data")
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
@@ -76,13 +244,30 @@ def get_logger() -> logging.Logger:
     formatter = RedactingFormatter(PII_FIELDS)
 
     handler.setFormatter(formatter)
+    if asynchronous is None:
+        asynchronous = os.getenv('PERSONAL_DATA_LOG_ASYNC') in ("1", "true")
+    if asynchronous:
+        size = int(os.getenv('PERSONAL_DATA_LOG_QUEUE_SIZE') or 10000)
+        overflow = os.getenv('PERSONAL_DATA_LOG_OVERFLOW') or "block"
+        records = queue.Queue(size)
+        listener = BatchQueueListener(records, handler)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = BoundedQueueHandler(records, overflow)
     logger.addHandler(handler)
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+def get_db() -> "mysql.connector.connection.MySQLConnection":
     """
+    Return a connection to the database holding the users table.
+
+    With PERSONAL_DATA_DB_ENGINE=sqlite, PERSONAL_DATA_DB_NAME is the path
+    of a local SQLite database used as a stand-in for MySQL.
     """
+    if os.getenv('PERSONAL_DATA_DB_ENGINE') == "sqlite":
+        return sqlite3.connect(os.getenv('PERSONAL_DATA_DB_NAME') or
+                               "personal_data.db")
     user = os.getenv('PERSONAL_DATA_DB_USERNAME') or "root"
     passwd = os.getenv('PERSONAL_DATA_DB_PASSWORD') or ""
     host = os.getenv('PERSONAL_DATA_DB_HOST') or "localhost"
@@ -94,19 +279,204 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return conn
 
 
+def format_row(formatter: logging.Formatter, fields: List[str],
+               row: tuple) -> str:
+    """
+    Format a users row the way the user_data logger logs it
+    """
+    message = "".join("{}={}; ".format(k, v) for k, v in zip(fields, row))
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               message.strip(), None, None)
+    return formatter.format(record)
+
+
+def open_cursor(db, query: str, params: tuple = ()):
+    """
+    Execute a query with a cursor streaming rows from the server.
+    Placeholders in query are written "?" whatever the database.
+    """
+    if isinstance(db, sqlite3.Connection):
+        cursor = db.cursor()
+    else:
+        cursor = db.cursor(buffered=False)
+        query = query.replace("?", "%s")
+    cursor.execute(query, params)
+    return cursor
+
+
+def export_users(db, output: TextIO, batch_size: int = 1000,
+                 progress: bool = False,
+                 query: str = "SELECT * FROM users;",
+                 params: tuple = ()) -> int:
+    """
+    Write the redacted log line of every user to output.
+
+    Rows are fetched, formatted and written batch_size at a time so that
+    memory does not depend on the size of the table.
+
+    Returns:
+        int: The number of exported rows.
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    cursor = open_cursor(db, query, params)
+    fields = [column[0] for column in cursor.description]
+    count = 0
+    start = last_report = time.monotonic()
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        lines = [format_row(formatter, fields, row) for row in rows]
+        lines.append("")
+        output.write("\n".join(lines))
+        count += len(rows)
+        if progress and time.monotonic() - last_report >= 1:
+            last_report = time.monotonic()
+            report_progress(count, last_report - start)
+    cursor.close()
+    output.flush()
+    if progress:
+        report_progress(count, time.monotonic() - start)
+    return count
+
+
+def report_progress(count: int, elapsed: float) -> None:
+    """
+    Print the number of exported rows and the throughput on stderr
+    """
+    rate = count / elapsed if elapsed > 0 else 0
+    print("exported {} rows in {:.1f}s ({:.0f} rows/s)".format(
+        count, elapsed, rate), file=sys.stderr, flush=True)
+
+
+def key_ranges(db, key: str, shards: int) -> List[Tuple[int, int]]:
+    """
+    Split the users table in shards ranges [start, end) of its
+    integer key column
+    """
+    cursor = open_cursor(db, f"SELECT MIN({key}), MAX({key}) FROM users;")
+    low, high = cursor.fetchone()
+    cursor.close()
+    if low is None:
+        return []
+    step = max(-(-(high - low + 1) // shards), 1)
+    return [(start, min(start + step, high + 1))
+            for start in range(low, high + 1, step)]
+
+
+def export_shard(path: str, key: str, start: int, end: int,
+                 batch_size: int) -> int:
+    """
+    Worker of export_users_parallel: export the users whose key is in
+    [start, end) to path, with its own database connection
+    """
+    db = get_db()
+    query = f"SELECT * FROM users WHERE {key} >= ? AND {key} < ? " \
+            f"ORDER BY {key};"
+    with open(path, "w", buffering=1 << 20) as output:
+        count = export_users(db, output, batch_size, False,
+                             query, (start, end))
+    db.close()
+    return count
+
+
+def export_users_parallel(output_path: str, workers: int, shards: int = 0,
+                          key: str = None, batch_size: int = 1000,
+                          keep_shards: bool = False,
+                          progress: bool = False) -> int:
+    """
+    Export the users table with a pool of worker processes.
+
+    The table is split in ranges of its primary key, each range is
+    redacted by a worker into its own file. Shard files are then
+    concatenated in key order into output_path (stderr if None), or
+    kept as <output_path>.<shard> if keep_shards is set.
+
+    Returns:
+        int: The number of exported rows.
+    """
+    db = get_db()
+    if key is None:
+        key = "rowid" if isinstance(db, sqlite3.Connection) else "id"
+    if not re.fullmatch(r"\w+", key):
+        raise ValueError(f"invalid key column: {key}")
+    ranges = key_ranges(db, key, shards or workers)
+    db.close()
+
+    start = time.monotonic()
+    shard_dir = None
+    if keep_shards and output_path is not None:
+        prefix = output_path
+    else:
+        shard_dir = tempfile.mkdtemp(prefix="personal_data_")
+        prefix = os.path.join(shard_dir, "users")
+    paths = ["{}.{:04d}".format(prefix, i) for i in range(len(ranges))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(
+            export_shard, paths, [key] * len(ranges),
+            [r[0] for r in ranges], [r[1] for r in ranges],
+            [batch_size] * len(ranges)))
+
+    if not keep_shards or output_path is None:
+        if output_path is not None:
+            output = open(output_path, "w", buffering=1 << 20)
+        else:
+            output = open(sys.stderr.fileno(), "w", buffering=1 << 20,
+                          closefd=False)
+        with output:
+            for path in paths:
+                with open(path, "r") as shard:
+                    shutil.copyfileobj(shard, output, 1 << 20)
+    if shard_dir is not None:
+        shutil.rmtree(shard_dir)
+    if progress:
+        report_progress(sum(counts), time.monotonic() - start)
+    return sum(counts)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """
+    Parse the command line of the export
+    """
+    parser = argparse.ArgumentParser(
+        description="Log the users table with PII fields redacted")
+    parser.add_argument("-o", "--output",
+                        help="output file (default: stderr, like the logger)")
+    parser.add_argument("-b", "--batch-size", type=int, default=1000,
+                        help="rows fetched and written at a time")
+    parser.add_argument("-p", "--progress", action="store_true",
+                        help="report progress and throughput on stderr")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="worker processes redacting key ranges")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="number of key ranges (default: --workers)")
+    parser.add_argument("--key",
+                        help="integer primary key column used to shard "
+                        "(default: rowid with SQLite, id otherwise)")
+    parser.add_argument("--keep-shards", action="store_true",
+                        help="write one <output>.<shard> file per shard "
+                        "instead of merging them")
+    return parser.parse_args(argv)
+
+
 def main():
     """
     main entry point
     """
+    args = parse_args()
+    if args.workers > 1:
+        export_users_parallel(args.output, args.workers, args.shards,
+                              args.key, args.batch_size, args.keep_shards,
+                              args.progress)
+        return
     db = get_db()
-    logger = get_logger()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users;")
-    fields = cursor.column_names
-    for row in cursor:
-        message = "".join("{}={}; ".format(k, v) for k, v in zip(fields, row))
-        logger.info(message.strip())
-    cursor.close()
+    if args.output is not None:
+        output = open(args.output, "w", buffering=1 << 20)
+    else:
+        output = open(sys.stderr.fileno(), "w", buffering=1 << 20,
+                      closefd=False)
+    with output:
+        export_users(db, output, args.batch_size, args.progress)
     db.close()
 
 
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Adaptive bcrypt cost policy
+
+0x00-personal_data and 0x03-user_authentication_service each keep an
+identical copy of this module: every project directory runs on its own,
+with no package shared between them. Change both together.
+"""
+import math
+import os
+import threading
+import time
+
+import bcrypt
+
+
+class BcryptPolicy:
+    """Chooses the bcrypt cost factor of new hashes.
+
+    Unless a fixed cost is configured, the host is benchmarked once and
+    the highest cost whose hash time stays under target_ms is used.
+    Each extra round doubles the work, so a single measure at a low
+    cost is enough to extrapolate. The calibrated cost is stored in
+    rounds_file, if given, so that restarts and the other processes of
+    the host reuse it instead of measuring a different one.
+    """
+
+    PROBE_ROUNDS = 6
+
+    def __init__(self, target_ms: float = 250, min_rounds: int = 10,
+                 max_rounds: int = 16, rounds: int = None,
+                 rounds_file: str = None) -> None:
+        """Initialize the policy, rounds fixes the cost"""
+        self.target_ms = target_ms
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.rounds_file = rounds_file
+        self.fixed = rounds is not None
+        self._rounds = rounds
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "BcryptPolicy":
+        """Build a policy configured by BCRYPT_TARGET_MS, BCRYPT_MIN_ROUNDS,
+        BCRYPT_MAX_ROUNDS, BCRYPT_ROUNDS and BCRYPT_ROUNDS_FILE
+        """
+        rounds = os.getenv("BCRYPT_ROUNDS")
+        return cls(float(os.getenv("BCRYPT_TARGET_MS", 250)),
+                   int(os.getenv("BCRYPT_MIN_ROUNDS", 10)),
+                   int(os.getenv("BCRYPT_MAX_ROUNDS", 16)),
+                   int(rounds) if rounds else None,
+                   os.getenv("BCRYPT_ROUNDS_FILE") or None)
+
+    def calibrate(self) -> int:
+        """Benchmark the host and return the cost meeting target_ms"""
+        password = b"calibration password"
+        salt = bcrypt.gensalt(self.PROBE_ROUNDS)
+        elapsed = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            bcrypt.hashpw(password, salt)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        extra = math.floor(math.log2(self.target_ms / 1000 / elapsed))
+        rounds = self.PROBE_ROUNDS + extra
+        return max(self.min_rounds, min(self.max_rounds, rounds))
+
+    def _load_rounds(self) -> int:
+        """Cost stored in rounds_file, calibrated and stored if missing"""
+        if self.rounds_file is None:
+            return self.calibrate()
+        try:
+            with open(self.rounds_file) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            pass
+        rounds = self.calibrate()
+        tmp_path = "{}.{}.tmp".format(self.rounds_file, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(str(rounds))
+        try:
+            os.link(tmp_path, self.rounds_file)
+        except FileExistsError:
+            # another process stored its cost first
+            with open(self.rounds_file) as f:
+                rounds = int(f.read())
+        finally:
+            os.remove(tmp_path)
+        return rounds
+
+    def rounds(self) -> int:
+        """Cost factor of new hashes, calibrated on first call"""
+        with self._lock:
+            if self._rounds is None:
+                self._rounds = self._load_rounds()
+            return self._rounds
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        """True if hashed_password was hashed with a lower cost than the
+        current one: a host measuring a lower cost never downgrades it"""
+        if isinstance(hashed_password, str):
+            hashed_password = hashed_password.encode("utf-8")
+        try:
+            cost = int(hashed_password.split(b"$")[2])
+        except (IndexError, ValueError):
+            return True
+        return cost < self.rounds()
+
+
+POLICY = BcryptPolicy.from_env()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Tests of the asynchronous logging of filtered_logger
+"""
+import io
+import logging
+import queue
+import unittest
+from unittest import mock
+
+from filtered_logger import BatchQueueListener
+
+
+class FailingStream(io.StringIO):
+    """ Stream whose first write fails """
+
+    failures = 1
+
+    def write(self, text: str) -> int:
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("disk full")
+        return super().write(text)
+
+
+def record(msg: str) -> logging.LogRecord:
+    """ A record of the user_data logger """
+    return logging.LogRecord("user_data", logging.INFO, __file__, 0, msg,
+                             None, None)
+
+
+class TestBatchQueueListener(unittest.TestCase):
+    """ The listener thread survives handler errors
+    """
+
+    def setUp(self):
+        """ Start a listener writing to a failing stream """
+        self.stream = FailingStream()
+        self.handler = logging.StreamHandler(self.stream)
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.records = queue.Queue(4)
+        self.listener = BatchQueueListener(self.records, self.handler,
+                                           batch_size=1)
+        errors = mock.patch.object(self.handler, "handleError")
+        self.handle_error = errors.start()
+        self.addCleanup(errors.stop)
+        self.listener.start()
+
+    def test_failing_write(self):
+        """ A failed write is reported and the next records are written """
+        for i in range(10):
+            # blocks forever if the thread died
+            self.records.put(record("line {}".format(i)), timeout=5)
+        self.listener.stop()
+        self.assertEqual(self.handle_error.call_count, 1)
+        self.assertEqual(self.stream.getvalue().splitlines(),
+                         ["line {}".format(i) for i in range(1, 10)])
+
+    def test_failing_format(self):
+        """ A record that can't be formatted is reported and skipped """
+        self.stream.failures = 0
+        self.records.put(record("ok"))
+        self.records.put(logging.LogRecord(
+            "user_data", logging.INFO, __file__, 0, "%d", ("x",), None))
+        self.records.put(record("still ok"))
+        self.listener.stop()
+        self.assertEqual(self.handle_error.call_count, 1)
+        self.assertEqual(self.stream.getvalue().splitlines(),
+                         ["ok", "still ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,16 +3,44 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.metrics import METRICS, instrument_app
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
+from models.base import STORAGE
+import inspect
 import os
 
 
 app = Flask(__name__)
+instrument_app(app, "/api/v1/metrics")
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
+EXCLUDED_PATHS = ['/api/v1/status/', '/api/v1/unauthorized/',
+                  '/api/v1/forbidden/']
+if os.getenv("METRICS_PUBLIC") == "1":
+    EXCLUDED_PATHS.append('/api/v1/metrics/')
+# a tuple, compiled once by require_auth
+EXCLUDED_PATHS = tuple(EXCLUDED_PATHS)
+
+
+def instrument_method(cls, name: str, metric: str, **labels: str) -> None:
+    """Time every call of a method, class method or static method of cls
+    without changing its source"""
+    attribute = inspect.getattr_static(cls, name)
+    if isinstance(attribute, (classmethod, staticmethod)):
+        wrapped = METRICS.timed(metric, **labels)(attribute.__func__)
+        setattr(cls, name, type(attribute)(wrapped))
+    else:
+        setattr(cls, name, METRICS.timed(metric, **labels)(attribute))
+
+
+METRICS.describe("store_operation_seconds",
+                 "Latency of the storage backend operations")
+for operation in ("load", "dump", "save", "remove", "search"):
+    instrument_method(type(STORAGE), operation, "store_operation_seconds",
+                      operation=operation)
 
 if os.getenv("AUTH_TYPE") == "auth":
     from .auth.auth import Auth
@@ -27,7 +55,7 @@ def before_request():
     '''Before request function for authorization'''
     if auth is None:
         return
-    if auth.require_auth(request.path, ['/api/v1/status/', '/api/v1/unauthorized/', '/api/v1/forbidden/']):  # nopep8
+    if auth.require_auth(request.path, EXCLUDED_PATHS):
         if auth.authorization_header(request) is None:
             abort(401)
         if auth.current_user(request) is None:
@@ -1,12 +1,65 @@
 #!/usr/bin/env python3
 """Classe to manage API authentication"""
+from api.v1.metrics import METRICS
 from flask import request
-from typing import TypeVar, List
+from functools import lru_cache
+from typing import TypeVar, List, Tuple
+import re
+
+
+class PathMatcher:
+    """Matches paths against a list of excluded paths, compiled once.
+
+    Trailing slashes are ignored and `*` matches any sequence of
+    characters, i.e. `/api/v1/stat*` excludes `/api/v1/status/`.
+    """
+
+    MEMO_SIZE = 4096
+
+    def __init__(self, excluded_paths: Tuple[str, ...]):
+        """Compile the excluded paths"""
+        self.exact = set()
+        patterns = []
+        for excluded in excluded_paths:
+            excluded = excluded.rstrip("/")
+            if "*" in excluded:
+                patterns.append(".*".join(
+                    re.escape(part) for part in excluded.split("*")))
+            else:
+                self.exact.add(excluded)
+        self.regex = None
+        if len(patterns) > 0:
+            self.regex = re.compile("|".join(patterns))
+        self.memo = {}
+
+    def match(self, path: str) -> bool:
+        """Check if path is excluded"""
+        excluded = self.memo.get(path)
+        if excluded is not None:
+            return excluded
+        normalized = path.rstrip("/")
+        excluded = normalized in self.exact or (
+            self.regex is not None and
+            self.regex.fullmatch(normalized) is not None)
+        if len(self.memo) >= self.MEMO_SIZE:
+            self.memo.clear()
+        self.memo[path] = excluded
+        return excluded
+
+
+@lru_cache(maxsize=32)
+def compile_excluded_paths(excluded_paths: Tuple[str, ...]) -> PathMatcher:
+    """Return the PathMatcher of a tuple of excluded paths"""
+    return PathMatcher(excluded_paths)
 
 
 class Auth:
     """Authentication class"""
 
+    # (excluded paths, matcher) of the last tuple of excluded paths
+    _compiled = ((), None)
+
+    @METRICS.timed("auth_phase_seconds", phase="require_auth")
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Check if path requires authentication
         Returns:
@@ -17,23 +70,17 @@ class Auth:
             return True
         if excluded_paths is None or len(excluded_paths) == 0:
             return True
-        if path in excluded_paths or (path + '/') in excluded_paths:
-            return False
-
-        # using regex to match paths with asterik sign
-        # checking for any match between the provided
-        # match and the excluded path
-
-        # matching the ends of the urls i.e end part of the url
-        end_input_url = path.split('/', 3)[-1]
-        for paths in excluded_paths:
-            if "*" in paths:
-                end_match_url = paths.split('/', 3)[-1].replace("*", "")
-                sim = re.search(f"^{end_match_url}", end_input_url)
-                if sim:
-                    return False
-
-        return True
+        # a tuple can't change: when the same one is passed on every
+        # request, its matcher is reused without hashing it. Lists are
+        # looked up by their contents, so that changes in place are seen
+        compiled, matcher = self._compiled
+        if excluded_paths is not compiled:
+            if isinstance(excluded_paths, tuple):
+                matcher = compile_excluded_paths(excluded_paths)
+                self._compiled = (excluded_paths, matcher)
+            else:
+                matcher = compile_excluded_paths(tuple(excluded_paths))
+        return not matcher.match(path)
 
     def authorization_header(self, request=None) -> str:
         """Check for authoriztion in the request header
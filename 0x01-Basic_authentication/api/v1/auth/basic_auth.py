@@ -1,8 +1,27 @@
 #!/usr/bin/env python3
 """Inherits from Auth to create a basic Auth"""
 from api.v1.auth.auth import Auth
+from api.v1.auth.credential_cache import CredentialCache
+from api.v1.metrics import METRICS
 from typing import TypeVar, List
 from models.user import User
+import os
+
+
+CREDENTIAL_CACHE = CredentialCache(
+    int(os.getenv("BASIC_AUTH_CACHE_SIZE", 1024)),
+    float(os.getenv("BASIC_AUTH_CACHE_TTL", 300)))
+
+
+def _invalidate_credentials(event: str, user: TypeVar('User')):
+    """Drop cached credentials when users are saved, removed or reloaded"""
+    if user is None:
+        CREDENTIAL_CACHE.clear()
+    else:
+        CREDENTIAL_CACHE.invalidate_user(user.id)
+
+
+User.subscribe(_invalidate_credentials)
 
 
 class BasicAuth(Auth):
@@ -90,16 +109,19 @@ class BasicAuth(Auth):
         if user_pwd is None or not isinstance(user_pwd, str):
             return None
         try:
-            users: List[TypeVar("User")] = User().search({"email": user_email})
+            with METRICS.time("auth_phase_seconds", phase="user_lookup"):
+                users: List[TypeVar("User")] = User().search(
+                    {"email": user_email})
         except Exception:
             return None
 
         if not users:
             return None
 
-        for user_obj in users:
-            if user_obj.is_valid_password(user_pwd):
-                return user_obj
+        with METRICS.time("auth_phase_seconds", phase="password_verify"):
+            for user_obj in users:
+                if user_obj.is_valid_password(user_pwd):
+                    return user_obj
 
         return None
 
@@ -107,6 +129,12 @@ class BasicAuth(Auth):
         """Fetches the current user based on the
         request's authorization header.
 
+        Headers already verified are resolved from CREDENTIAL_CACHE
+        without decoding them nor hashing the password, as long as the
+        password digest of the user is still the one they were verified
+        with: storages shared by processes (SQLite) don't notify this
+        one of the changes.
+
         Args:
             request: The Flask request object.
 
@@ -117,14 +145,28 @@ class BasicAuth(Auth):
         header = Auth().authorization_header(request)
         if header is None:
             return None
-        b64_header = self.extract_base64_authorization_header(header)
-        if b64_header is None:
-            return None
-        decoded_header = self.decode_base64_authorization_header(b64_header)
-        if decoded_header is None:
-            return None
-        credentials = self.extract_user_credentials(decoded_header)
-        if credentials is None or len(credentials) != 2:
-            return None
+        # users changed by other workers invalidate their credentials
+        User.sync()
+        cached = CREDENTIAL_CACHE.get(header)
+        if cached is not None:
+            user = User.get(cached[0])
+            if user is not None and user._digest == cached[1]:
+                return user
+            # changed by another process: verify the header again
+            CREDENTIAL_CACHE.invalidate_user(cached[0])
+        with METRICS.time("auth_phase_seconds", phase="header_decode"):
+            b64_header = self.extract_base64_authorization_header(header)
+            if b64_header is None:
+                return None
+            decoded_header = self.decode_base64_authorization_header(
+                b64_header)
+            if decoded_header is None:
+                return None
+            credentials = self.extract_user_credentials(decoded_header)
+            if credentials is None or len(credentials) != 2:
+                return None
         email, pwd = credentials
-        return self.user_object_from_credentials(email, pwd)
+        user = self.user_object_from_credentials(email, pwd)
+        if user is not None:
+            CREDENTIAL_CACHE.put(header, user.id, user._digest)
+        return user
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Cache of verified Authorization headers"""
+from collections import OrderedDict
+from typing import Dict, Tuple
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+class CredentialCache:
+    """Bounded LRU cache mapping an Authorization header to the ID and
+    the password digest of the user it was verified for.
+
+    Headers are never stored: keys are an HMAC of the header with a
+    per-process secret. The digest lets callers reject an entry whose
+    user changed password in another process.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        """Initialize the cache
+        Args:
+            max_size (int): maximum number of entries, 0 disables the cache
+            ttl (float): lifetime of an entry in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def _key(self, header: str) -> bytes:
+        """Keyed hash of a header"""
+        return hmac.new(self._secret, header.encode("utf-8"),
+                        hashlib.sha256).digest()
+
+    def get(self, header: str) -> Tuple[str, bytes]:
+        """Return the user ID and password digest cached for a header
+        Returns:
+            - None if the header is not cached or expired
+        """
+        key = self._key(header)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def put(self, header: str, user_id: str, digest: bytes):
+        """Cache the user ID and password digest verified for a header"""
+        if self.max_size <= 0:
+            return
+        key = self._key(header)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (user_id, time.monotonic() + self.ttl,
+                                  digest)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: str):
+        """Drop every entry of a user"""
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _discard(self, key: bytes):
+        """Remove an entry, the lock must be held"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[0])
+        keys.discard(key)
+        if len(keys) == 0:
+            del self._keys_by_user[entry[0]]
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the cache"""
+        return {"size": len(self._entries), "hits": self.hits,
+                "misses": self.misses}
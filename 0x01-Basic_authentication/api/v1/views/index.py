@@ -3,6 +3,7 @@
 """
 from flask import jsonify, abort
 from api.v1.views import app_views
+from os import getenv
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -23,6 +24,9 @@ def stats() -> str:
     from models.user import User
     stats = {}
     stats['users'] = User.count()
+    if getenv("AUTH_TYPE") == "basic_auth":
+        from api.v1.auth.basic_auth import CREDENTIAL_CACHE
+        stats['credential_cache'] = CREDENTIAL_CACHE.stats()
     return jsonify(stats)
 
 
@@ -2,18 +2,84 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (abort, jsonify, json, request, stream_with_context,
+                   url_for, Response)
+from models.timestamps import from_epoch
 from models.user import User
+import os
+
+
+BATCH_MAX = int(os.getenv("USERS_BATCH_MAX", 10000))
+
+
+def stream_users(after: str = None, limit: int = None):
+    """ Yield a JSON array of users chunk by chunk
+    """
+    yield "["
+    separator = ""
+    for user in User.iterate(after, limit):
+        yield separator + json.dumps(user.to_json())
+        separator = ","
+    yield "]"
+
+
+def conditional(etag: str, last_modified, build) -> Response:
+    """ Answer 304 if the client already has the representation `etag`
+    (If-None-Match), else the response of `build()`; both with the ETag
+    and Last-Modified headers.
+
+    `etag` must be read before the data `build` returns, so that it is
+    never newer than the data.
+    """
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+    if etag is not None:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): maximum number of User objects returned
+      - after (optional): ID of the last User of the previous page
+      - stream (optional): if true, the list is streamed
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented, ordered by ID
+      - 304 if the If-None-Match header has the ETag of the users
+      - 400 if limit is not a positive integer
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    after = request.args.get("after")
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    version = User.store_version()
+    etag, last_modified = (None, None) if version is None else \
+        (version[0], from_epoch(version[1]))
+    if request.args.get("stream", "").lower() in ("1", "true"):
+        return conditional(etag, last_modified, lambda: Response(
+            stream_with_context(stream_users(after, limit)),
+            mimetype="application/json"))
+
+    def build():
+        users = User.page(after, limit)
+        response = jsonify([user.to_json() for user in users])
+        if limit is not None and len(users) == limit:
+            next_url = url_for("app_views.view_all_users",
+                               limit=limit, after=users[-1].id)
+            response.headers["Link"] = '<{}>; rel="next"'.format(next_url)
+        return response
+    return conditional(etag, last_modified, build)
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -23,6 +89,7 @@ def view_one_user(user_id: str = None) -> str:
       - User ID
     Return:
       - User object JSON represented
+      - 304 if the If-None-Match header has the ETag of the User
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
@@ -30,7 +97,8 @@ def view_one_user(user_id: str = None) -> str:
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    return conditional(user.version, user.updated_at,
+                       lambda: jsonify(user.to_json()))
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -64,12 +132,22 @@ def create_user() -> str:
       - 400 if can't create the new User
     """
     rj = None
-    error_msg = None
     try:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
+    result, status = create_one(rj)
+    return jsonify(result), status
+
+
+def create_one(rj: dict) -> (dict, int):
+    """ Create a User from the JSON body of a creation
+    Return:
+      - User object JSON represented and 201
+      - error and 400 if can't create the new User
+    """
+    error_msg = None
+    if not isinstance(rj, dict):
         error_msg = "Wrong format"
     if error_msg is None and rj.get("email", "") == "":
         error_msg = "email missing"
@@ -83,10 +161,10 @@ def create_user() -> str:
             user.first_name = rj.get("first_name")
             user.last_name = rj.get("last_name")
             user.save()
-            return jsonify(user.to_json()), 201
+            return user.to_json(), 201
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
-    return jsonify({'error': error_msg}), 400
+    return {'error': error_msg}, 400
 
 
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
@@ -112,11 +190,69 @@ def update_user(user_id: str = None) -> str:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
-        return jsonify({'error': "Wrong format"}), 400
+    result, status = update_one(user, rj)
+    return jsonify(result), status
+
+
+def update_one(user: User, rj: dict) -> (dict, int):
+    """ Update a User from the JSON body of an update
+    Return:
+      - User object JSON represented and 200
+      - error and 400 if the body is not a JSON object
+    """
+    if not isinstance(rj, dict):
+        return {'error': "Wrong format"}, 400
     if rj.get('first_name') is not None:
         user.first_name = rj.get('first_name')
     if rj.get('last_name') is not None:
         user.last_name = rj.get('last_name')
     user.save()
-    return jsonify(user.to_json()), 200
+    return user.to_json(), 200
+
+
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def batch_users() -> str:
+    """ POST /api/v1/users/batch
+    JSON body: list of operations, applied in order
+      - {"op": "create", "email", "password", "first_name", "last_name"}
+      - {"op": "update", "id", "first_name", "last_name"}
+      - {"op": "delete", "id"}
+    Return:
+      - list of results, one per operation: {"status"} and the User
+        object JSON represented ("user") or the error ("error")
+      - 400 if the body is not a list of at most USERS_BATCH_MAX operations
+    All the mutations are persisted together, e.g. by a single write.
+    """
+    rj = None
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if not isinstance(rj, list):
+        return jsonify({'error': "Wrong format"}), 400
+    if len(rj) > BATCH_MAX:
+        return jsonify({'error': "too many operations, the maximum is {}"
+                        .format(BATCH_MAX)}), 400
+    results = []
+    with User.batch():
+        for operation in rj:
+            op = operation.get("op") if isinstance(operation, dict) else None
+            if op == "create":
+                result, status = create_one(operation)
+            elif op in ("update", "delete"):
+                user = User.get(operation.get("id")) \
+                    if isinstance(operation.get("id"), str) else None
+                if user is None:
+                    result, status = {'error': "Not found"}, 404
+                elif op == "update":
+                    result, status = update_one(user, operation)
+                else:
+                    user.remove()
+                    result, status = {}, 200
+            else:
+                result, status = {'error': "unknown op"}, 400
+            if status < 400:
+                result = {'user': result} if result else {}
+            result['status'] = status
+            results.append(result)
+    return jsonify(results), 200
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+""" Benchmark of user provisioning: one POST /api/v1/users per user vs
+one POST /api/v1/users/batch
+
+Usage:
+    $ python3 bench_batch.py [size ...]
+
+Every storage runs in a fresh process and a temporary directory.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+DEFAULT_SIZES = (1000, 10000)
+STORAGES = (
+    ("json, snapshot", {"MODELS_PERSISTENCE": "snapshot"}),
+    ("json, journal", {"MODELS_PERSISTENCE": "journal"}),
+    ("sqlite", {"MODELS_STORAGE": "sqlite"}),
+)
+# one creation per request is quadratic with snapshots
+MAX_SINGLE = 2000
+PROVISION = """
+import base64, json, sys, time
+from api.v1.app import app
+from models.user import User
+size, single = int(sys.argv[1]), sys.argv[2] == "1"
+User.load_from_file()
+admin = User(email="admin@example.com")
+admin.password = "pwd"
+admin.save()
+client = app.test_client()
+headers = {"Authorization": "Basic " + base64.b64encode(
+    b"admin@example.com:pwd").decode()}
+users = [{"email": "user{}@example.com".format(i), "password": "pwd"}
+         for i in range(size)]
+result = {}
+if single:
+    start = time.perf_counter()
+    for user in users:
+        assert client.post("/api/v1/users", json=user,
+                           headers=headers).status_code == 201
+    result["single"] = time.perf_counter() - start
+    users = [dict(user, email="batch" + user["email"]) for user in users]
+start = time.perf_counter()
+response = client.post("/api/v1/users/batch", headers=headers,
+                       json=[dict(user, op="create") for user in users])
+assert all(item["status"] == 201 for item in response.json)
+result["batch"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def provision(env: dict, size: int, single: bool) -> dict:
+    """ Create `size` users in a new process, one by one then in a batch
+    if `single`, else in a batch only
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, AUTH_TYPE="basic_auth", PYTHONPATH=os.path
+                   .dirname(os.path.abspath(__file__)), **env)
+        output = subprocess.run(
+            [sys.executable, "-c", PROVISION, str(size),
+             "1" if single else "0"], cwd=directory, env=env, check=True,
+            capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>8} {:<16} {:>12} {:>12} {:>9}".format(
+        "users", "storage", "single (s)", "batch (s)", "speedup"))
+    for size in sizes:
+        for name, env in STORAGES:
+            result = provision(env, size, size <= MAX_SINGLE)
+            if "single" in result:
+                print("{:>8} {:<16} {:>12.2f} {:>12.2f} {:>8.0f}x".format(
+                    size, name, result["single"], result["batch"],
+                    result["single"] / result["batch"]))
+            else:
+                print("{:>8} {:<16} {:>12} {:>12.2f} {:>9}".format(
+                    size, name, "-", result["batch"], "-"))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Benchmark of polling the users: full responses vs 304 answers to
+If-None-Match
+
+Usage:
+    $ python3 bench_etag.py [size ...]
+
+The JSON storage is filled in memory only, requests go through the
+Flask test client without authentication.
+"""
+import sys
+import time
+from api.v1.app import app
+from models.base import DATA, SORTED_IDS
+from models.user import User
+
+
+DEFAULT_SIZES = (100, 1000, 10000)
+POLLS = 200
+
+
+def populate(size: int):
+    """ Fill DATA['User'] with `size` users
+    """
+    DATA['User'] = {}
+    for i in range(size):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First", last_name="Last")
+        DATA['User'][user.id] = user
+    SORTED_IDS.pop('User', None)
+    User.reindex()
+
+
+def poll(client, url: str, conditional: bool) -> float:
+    """ Mean milliseconds of a GET of `url`, sending the ETag of the
+    previous response if `conditional`
+    """
+    etag = client.get(url).headers["ETag"]
+    headers = {"If-None-Match": etag} if conditional else {}
+    expected = 304 if conditional else 200
+    start = time.perf_counter()
+    for _ in range(POLLS):
+        assert client.get(url, headers=headers).status_code == expected
+    return (time.perf_counter() - start) / POLLS * 1000
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    client = app.test_client()
+    print("{:>8} {:<16} {:>10} {:>10}".format(
+        "users", "url", "200 (ms)", "304 (ms)"))
+    for size in sizes:
+        populate(size)
+        user_id = next(iter(DATA['User']))
+        for name, url in (("/users", "/api/v1/users"),
+                          ("/users/:id", "/api/v1/users/" + user_id)):
+            print("{:>8} {:<16} {:>10.3f} {:>10.3f}".format(
+                size, name, poll(client, url, False),
+                poll(client, url, True)))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+""" Benchmark of the memory used per User: compact slots vs the former
+__dict__ layout (datetimes, hexadecimal password, one string per name)
+
+Usage:
+    $ python3 bench_memory.py [size ...]
+
+Objects are created in memory only, nothing is written to disk.
+"""
+from datetime import datetime
+import hashlib
+import sys
+import tracemalloc
+import uuid
+from models.base import DATA
+from models.memory import memory_report
+from models.user import User
+
+
+DEFAULT_SIZES = (10000, 100000)
+FIRST_NAMES = ("Alice", "Bob", "Carol", "Dave", "Eve", "Frank", "Grace")
+LAST_NAMES = ("Smith", "Jones", "Brown", "Taylor", "Wilson", "Davies")
+
+
+class DictUser():
+    """ Reference: a user laid out like before the compact representation
+    """
+
+    def __init__(self, email: str, first_name: str, last_name: str):
+        """ Initialize a DictUser
+        """
+        self.id = str(uuid.uuid4())
+        self.created_at = datetime.utcnow()
+        self.updated_at = datetime.utcnow()
+        self.email = email
+        self._password = hashlib.sha256(email.encode()).hexdigest().lower()
+        # names read from JSON are distinct strings
+        self.first_name = "".join(first_name)
+        self.last_name = "".join(last_name)
+
+
+def build(cls, size: int) -> dict:
+    """ Create `size` users of `cls`, return them by ID
+    """
+    objs = {}
+    for i in range(size):
+        email = "user{}@example.com".format(i)
+        first_name = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last_name = LAST_NAMES[i % len(LAST_NAMES)]
+        if cls is User:
+            user = User(email=email, first_name="".join(first_name),
+                        last_name="".join(last_name))
+            user.password = email
+        else:
+            user = cls(email, first_name, last_name)
+        objs[user.id] = user
+    return objs
+
+
+def measure(cls, size: int) -> (float, float):
+    """ Bytes per user: from memory_report and from tracemalloc
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    DATA[cls.__name__] = build(cls, size)
+    traced = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    report = memory_report([cls.__name__])[cls.__name__]
+    del DATA[cls.__name__]
+    return report["bytes_per_object"], traced / size
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>10} {:>14} {:>14} {:>14} {:>14}".format(
+        "users", "dict (B/user)", "slots (B/user)", "dict traced",
+        "slots traced"))
+    for size in sizes:
+        dict_report, dict_traced = measure(DictUser, size)
+        slots_report, slots_traced = measure(User, size)
+        print("{:>10} {:>14.0f} {:>14.0f} {:>14.0f} {:>14.0f}".format(
+            size, dict_report, slots_report, dict_traced, slots_traced))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Microbenchmark of Auth.require_auth with many excluded paths
+
+Usage:
+    $ python3 bench_require_auth.py [number_of_patterns ...]
+
+Compares the compiled matcher (memoized and cold) with a linear scan
+that rebuilds a regex for every wildcard entry on every call.
+"""
+import re
+import sys
+import time
+from api.v1.auth.auth import Auth, PathMatcher
+
+
+DEFAULT_SIZES = (10, 100, 500)
+CALLS = 20000
+
+
+def linear_require_auth(path: str, excluded_paths: list) -> bool:
+    """ Reference implementation scanning the list on every call
+    """
+    if path in excluded_paths or (path + '/') in excluded_paths:
+        return False
+    for excluded in excluded_paths:
+        if "*" in excluded:
+            prefix = excluded.replace("*", "")
+            if re.search("^{}".format(re.escape(prefix)), path):
+                return False
+    return True
+
+
+def excluded_paths(size: int) -> list:
+    """ Half exact paths, half wildcard prefixes
+    """
+    paths = []
+    for i in range(size):
+        if i % 2:
+            paths.append("/api/v1/public{}/*".format(i))
+        else:
+            paths.append("/api/v1/static{}/".format(i))
+    return paths
+
+
+def timed(fn, paths: list) -> float:
+    """ Average latency of `fn` over `paths`, in nanoseconds
+    """
+    start = time.perf_counter()
+    for path in paths:
+        fn(path)
+    return (time.perf_counter() - start) / len(paths) * 1e9
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    requests = ["/api/v1/users", "/api/v1/users/42", "/api/v1/status",
+                "/api/v1/public1/css/app.css"]
+    paths = (requests * CALLS)[:CALLS]
+    print("{:>9} {:>14} {:>14} {:>14}".format(
+        "patterns", "memoized (ns)", "cold (ns)", "linear (ns)"))
+    for size in sizes:
+        excluded = excluded_paths(size)
+        auth = Auth()
+        frozen = tuple(excluded)
+        memoized = timed(lambda p: auth.require_auth(p, frozen), paths)
+        matcher = PathMatcher(tuple(excluded))
+        cold = timed(lambda p: matcher.memo.clear() or matcher.match(p),
+                     paths)
+        linear = timed(lambda p: linear_require_auth(p, excluded),
+                       paths[:CALLS // 10])
+        print("{:>9} {:>14.0f} {:>14.0f} {:>14.0f}".format(
+            size, memoized, cold, linear))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Benchmark of User.search by email: secondary index vs full scan,
+and the same search with the SQLite storage
+
+Usage:
+    $ python3 bench_search.py [size ...]
+
+The JSON storage is filled in memory only; the SQLite database is
+created in a temporary directory.
+"""
+import os
+import sys
+import tempfile
+import time
+from models.base import DATA
+from models.engine.sqlite_storage import SQLiteStorage
+from models.user import User
+
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+LOOKUPS = 1000
+
+
+def populate(size: int):
+    """ Fill DATA['User'] with `size` users and rebuild the indexes
+    """
+    DATA['User'] = {}
+    for i in range(size):
+        user = User(email="user{}@example.com".format(i))
+        DATA['User'][user.id] = user
+    User.reindex()
+
+
+def populate_sqlite(size: int) -> SQLiteStorage:
+    """ Create a SQLite storage holding `size` users
+    """
+    storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    storage.load(User)
+    storage.connection.execute("BEGIN")
+    for user in DATA['User'].values():
+        storage.save(user)
+    storage.connection.execute("COMMIT")
+    return storage
+
+
+def scan(email: str) -> list:
+    """ Reference full scan, equivalent to the non-indexed search
+    """
+    return [u for u in DATA['User'].values() if u.email == email]
+
+
+def timed(fn, emails: list) -> float:
+    """ Average latency of `fn` over `emails`, in microseconds
+    """
+    start = time.perf_counter()
+    for email in emails:
+        fn(email)
+    return (time.perf_counter() - start) / len(emails) * 1e6
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>10} {:>14} {:>14} {:>14}".format(
+        "users", "indexed (us)", "scan (us)", "sqlite (us)"))
+    for size in sizes:
+        populate(size)
+        step = max(size // LOOKUPS, 1)
+        emails = ["user{}@example.com".format(i)
+                  for i in range(0, size, step)][:LOOKUPS]
+        indexed = timed(lambda e: User.search({"email": e}), emails)
+        # full scans are slow on big tables: sample fewer lookups
+        full = timed(scan, emails[:max(10, 10000000 // size // 100)])
+        storage = populate_sqlite(size)
+        sqlite = timed(lambda e: storage.search(User, {"email": e}), emails)
+        storage.close()
+        print("{:>10} {:>14.2f} {:>14.2f} {:>14.2f}".format(
+            size, indexed, full, sqlite))
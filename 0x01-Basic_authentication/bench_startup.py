@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" Benchmark of the API startup: time to first request with JSON or
+binary snapshots, loaded eagerly or lazily
+
+Usage:
+    $ python3 bench_startup.py [size ...]
+
+A snapshot of `size` users is generated in a temporary directory, then
+each configuration imports the app and serves one authenticated
+GET /api/v1/users/:id in a fresh process.
+"""
+from base64 import b64encode
+import hashlib
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import uuid
+
+
+DEFAULT_SIZES = (1000000,)
+PASSWORD = "pwd"
+CONFIGS = (
+    ("json, eager", "json", "0"),
+    ("json, lazy", "json", "1"),
+    ("binary, eager", "binary", "0"),
+    ("binary, lazy", "binary", "1"),
+)
+FIRST_REQUEST = """
+import json, resource, sys, time
+start = time.perf_counter()
+from api.v1.app import app
+loaded = time.perf_counter()
+response = app.test_client().get(
+    "/api/v1/users/" + sys.argv[1],
+    headers={"Authorization": "Basic " + sys.argv[2]})
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({"load": loaded - start, "request": done - loaded,
+                  "total": done - start, "rss": resource.getrusage(
+                      resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def generate(directory: str, size: int) -> (str, str):
+    """ Write the JSON and binary snapshots of `size` users
+    Return:
+        the ID and the email of the last user
+    """
+    fields = ("id", "created_at", "updated_at", "email", "_password",
+              "first_name", "last_name")
+    digest = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    rows = [(str(uuid.uuid4()), 1700000000 + i, 1700000000 + i,
+             "user{}@example.com".format(i), digest, "First", "Last")
+            for i in range(size)]
+    with open(os.path.join(directory, ".db_User.bin"), "wb") as f:
+        pickle.dump({"version": 1, "fields": fields, "rows": rows}, f, 4)
+    with open(os.path.join(directory, ".db_User.json"), "w") as f:
+        json.dump({row[0]: dict(zip(fields, row[:1] + (
+            "2023-11-14T22:13:20",) * 2 + row[3:])) for row in rows}, f)
+    return rows[-1][0], rows[-1][3]
+
+
+def first_request(directory: str, snapshot_format: str, lazy: str,
+                  user_id: str, email: str) -> dict:
+    """ Start the app in a new process and serve one request
+    """
+    env = dict(os.environ, AUTH_TYPE="basic_auth", MODELS_STORAGE="json",
+               MODELS_SNAPSHOT_FORMAT=snapshot_format, MODELS_LAZY=lazy,
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    credentials = b64encode("{}:{}".format(email, PASSWORD).encode())
+    output = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST, user_id,
+         credentials.decode()], cwd=directory, env=env, check=True,
+        capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>10} {:<15} {:>10} {:>13} {:>13} {:>9}".format(
+        "users", "snapshot", "load (s)", "request (ms)", "to first (s)",
+        "RSS (MB)"))
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            user_id, email = generate(directory, size)
+            for name, snapshot_format, lazy in CONFIGS:
+                result = first_request(directory, snapshot_format, lazy,
+                                       user_id, email)
+                print("{:>10} {:<15} {:>10.2f} {:>13.1f} {:>13.2f} {:>9.0f}"
+                      .format(size, name, result["load"],
+                              result["request"] * 1000, result["total"],
+                              result["rss"]))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+""" Benchmark of the JSON storage shared by several processes
+
+Usage:
+    $ python3 bench_workers.py [size] [workers]
+
+- coherence: `workers` processes save users concurrently with each
+  persistence mode; users found after a reload vs users saved
+- memory: `workers` processes forked after loading `size` users (binary
+  snapshot, lazily or not) look up users; memory they don't share with
+  the parent, with and without gc.freeze() before forking
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_startup import generate
+
+
+DEFAULT_SIZE = 1000000
+DEFAULT_WORKERS = 4
+SAVES = 300
+LOOKUPS = 10000
+COHERENCE = """
+import json, os, sys, time
+from models.user import User
+User.load_from_file()
+workers, saves = int(sys.argv[1]), int(sys.argv[2])
+start = time.perf_counter()
+pids = []
+for worker in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        errors = 0
+        for i in range(saves):
+            try:
+                User(email="w{}-{}@example.com".format(worker, i)).save()
+            except OSError:
+                errors += 1
+        os._exit(min(errors, 255))
+    pids.append(pid)
+errors = sum(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+             for pid in pids)
+elapsed = time.perf_counter() - start
+seen = User.count()
+User.load_from_file()
+print(json.dumps({"saved": workers * saves, "seen": seen,
+                  "stored": User.count(), "errors": errors,
+                  "us_per_save": elapsed / saves * 1e6}))
+"""
+MEMORY = """
+import gc, json, os, random, sys
+from models.engine.file_storage import DATA, RAW
+from models.user import User
+User.load_from_file()
+User.search({"email": "user0@example.com"})
+workers, lookups, freeze = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+# users not built yet by the parent, if it loads them lazily
+ids = random.Random(0).sample(sorted(RAW["User"] or DATA["User"]), lookups)
+if freeze == "1":
+    gc.freeze()
+pids, pipes = [], []
+for worker in range(workers):
+    done_r, done_w = os.pipe()
+    quit_r, quit_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        for obj_id in ids:
+            User.get(obj_id)
+            User.search({"email": "user1@example.com"})
+        gc.collect()
+        os.write(done_w, b"1")
+        os.read(quit_r, 1)
+        os._exit(0)
+    pids.append(pid)
+    pipes.append((done_r, quit_w))
+private = 0
+for pid, (done_r, quit_w) in zip(pids, pipes):
+    os.read(done_r, 1)
+    with open("/proc/{}/smaps_rollup".format(pid)) as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                private += int(line.split()[1])
+    os.write(quit_w, b"1")
+    os.waitpid(pid, 0)
+print(json.dumps({"private_mb": private / 1024 / workers}))
+"""
+
+
+def run(script: str, directory: str, env: dict, *args) -> dict:
+    """ Run a script in a new process from `directory`
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(
+        os.path.abspath(__file__)), **env)
+    output = subprocess.run(
+        [sys.executable, "-c", script] + [str(arg) for arg in args],
+        cwd=directory, env=env, check=True, capture_output=True,
+        text=True).stdout
+    return json.loads(output)
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WORKERS
+
+    print("coherence: {} processes x {} saves".format(workers, SAVES))
+    print("{:<10} {:>8} {:>8} {:>8} {:>8} {:>10}".format(
+        "mode", "saved", "seen", "stored", "errors", "us/save"))
+    for persistence in ("snapshot", "journal", "shared"):
+        with tempfile.TemporaryDirectory() as directory:
+            result = run(COHERENCE, directory, {
+                "MODELS_PERSISTENCE": persistence,
+                "MODELS_JOURNAL_MIN_BYTES": "16384"}, workers, SAVES)
+        print("{:<10} {:>8} {:>8} {:>8} {:>8} {:>10.0f}".format(
+            persistence, result["saved"], result["seen"], result["stored"],
+            result["errors"], result["us_per_save"]))
+
+    print("\nmemory: {} users, {} workers x {} lookups".format(
+        size, workers, LOOKUPS))
+    print("{:<10} {:<10} {:>20}".format("loading", "gc", "private MB/worker"))
+    with tempfile.TemporaryDirectory() as directory:
+        generate(directory, size)
+        os.remove(os.path.join(directory, ".db_User.json"))
+        for lazy in ("1", "0"):
+            for freeze in ("0", "1"):
+                result = run(MEMORY, directory, {
+                    "MODELS_SNAPSHOT_FORMAT": "binary", "MODELS_LAZY": lazy},
+                    workers, LOOKUPS, freeze)
+                print("{:<10} {:<10} {:>20.1f}".format(
+                    "lazy" if lazy == "1" else "eager",
+                    "freeze" if freeze == "1" else "default",
+                    result["private_mb"]))
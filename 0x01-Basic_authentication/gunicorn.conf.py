@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+""" Gunicorn settings to run the API with several workers on one host
+
+Usage:
+    $ MODELS_PERSISTENCE=shared AUTH_TYPE=basic_auth gunicorn api.v1.app:app
+
+The app and the users it loads are imported once by the master process,
+the workers are forked from it and share these memory pages. Users are
+built by the master (MODELS_LAZY=0 unless set): built lazily, each
+worker would keep its own copy of the users it reads.
+"""
+import gc
+import os
+
+
+os.environ.setdefault("MODELS_LAZY", "0")
+
+bind = "{}:{}".format(os.getenv("API_HOST", "0.0.0.0"),
+                      os.getenv("API_PORT", "5000"))
+workers = int(os.getenv("API_WORKERS", os.cpu_count() or 1))
+preload_app = True
+
+
+def on_starting(server):
+    """ Warn when the workers would not see each other's writes
+    """
+    persistence = os.getenv("MODELS_PERSISTENCE", "snapshot")
+    storage = os.getenv("MODELS_STORAGE", "json")
+    if workers > 1 and storage == "json" and persistence != "shared":
+        server.log.warning("MODELS_PERSISTENCE=%s with %d workers: writes "
+                           "of a worker are lost or unseen by the others, "
+                           "use MODELS_PERSISTENCE=shared",
+                           persistence, workers)
+
+
+def pre_fork(server, worker):
+    """ Keep the objects loaded by the master out of the garbage collector
+    of the workers: a collection writes to every object it visits, which
+    would copy their pages in each worker
+    """
+    gc.freeze()
@@ -2,38 +2,89 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from typing import TypeVar, List, Iterable, Tuple
+import atexit
+import time
 import uuid
 
+from models.engine import storage_from_env
+# state of the JSON storage, still importable from models.base
+from models.engine.file_storage import (  # noqa: F401
+    PERSISTENCE, DATA, LOCK, WRITE_LOCK, INDEXES, SORTED_IDS)
+from models.timestamps import (  # noqa: F401
+    TIMESTAMP_FORMAT, format_epoch, from_epoch, to_epoch)
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+
+STORAGE = storage_from_env()
+LISTENERS = {}
+
+
+def flush():
+    """ Write pending mutations of the storage
+    """
+    STORAGE.flush()
+
+
+def shutdown():
+    """ Write pending mutations and release the storage
+    """
+    STORAGE.close()
+
+
+atexit.register(shutdown)
 
 
 class Base():
     """ Base class
+
+    Objects are stored by STORAGE (see models.engine). Subclasses can
+    declare secondary indexes in `__indexes__`: each entry is an attribute
+    name or a tuple of attribute names (composite index). Equality
+    searches covering an index are resolved without scanning every object.
+
+    Instances have no `__dict__`: subclasses declare their attributes in
+    `__slots__` and the keys of to_json() in `__fields__`. Timestamps are
+    kept as integer seconds since the epoch, `created_at` and
+    `updated_at` are datetime properties over them.
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at')
+    __fields__ = ('id', 'created_at', 'updated_at')
+    __indexes__ = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
         self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.updated_at = datetime.utcnow()
+        now = int(time.time())
+        created_at = kwargs.get('created_at')
+        self._created_at = now if created_at is None else to_epoch(created_at)
+        updated_at = kwargs.get('updated_at')
+        self._updated_at = now if updated_at is None else to_epoch(updated_at)
+
+    @property
+    def created_at(self) -> datetime:
+        """ Creation time, naive UTC
+        """
+        return from_epoch(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Set the creation time from a naive UTC datetime
+        """
+        self._created_at = to_epoch(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Last update time, naive UTC
+        """
+        return from_epoch(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Set the last update time from a naive UTC datetime
+        """
+        self._updated_at = to_epoch(value)
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -48,7 +99,15 @@ class Base():
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key in self.__fields__:
+            if not for_serialization and key[0] == '_':
+                continue
+            if key == 'created_at' or key == 'updated_at':
+                result[key] = format_epoch(getattr(self, '_' + key))
+            else:
+                result[key] = getattr(self, key)
+        # attributes of subclasses without __slots__
+        for key, value in getattr(self, '__dict__', {}).items():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,56 +116,88 @@ class Base():
                 result[key] = value
         return result
 
+    def to_row(self) -> tuple:
+        """ Values of `__fields__`, timestamps in seconds since the epoch
+        """
+        return tuple(getattr(self, '_' + key)
+                     if key == 'created_at' or key == 'updated_at'
+                     else getattr(self, key) for key in self.__fields__)
+
+    @classmethod
+    def from_row(cls, row: tuple) -> TypeVar('Base'):
+        """ Build an object from the values of `__fields__`
+        """
+        return cls(**dict(zip(cls.__fields__, row)))
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from the storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        STORAGE.load(cls)
+        cls.notify("load", None)
+
+    @classmethod
+    def subscribe(cls, callback):
+        """ Register `callback(event, obj)` to be called after each
+        "save", "remove" or "load" (obj is None) of the class
+        """
+        LISTENERS.setdefault(cls.__name__, []).append(callback)
+
+    @classmethod
+    def notify(cls, event: str, obj: TypeVar('Base')):
+        """ Call the listeners of the class
+        """
+        for callback in LISTENERS.get(cls.__name__, []):
+            callback(event, obj)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def sync(cls):
+        """ Apply the changes made by other processes sharing the storage
+        """
+        STORAGE.sync(cls)
+
+    @classmethod
+    def reindex(cls):
+        """ Rebuild all secondary indexes from the loaded objects
+        """
+        STORAGE.reindex(cls)
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Write all objects to durable storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        STORAGE.dump(cls)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def batch(cls):
+        """ Context in which saved and removed objects are persisted
+        together when it exits, e.g. a single snapshot write:
+
+            with User.batch():
+                for user in users:
+                    user.save()
+        """
+        return STORAGE.batch()
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self._updated_at = int(time.time())
+        STORAGE.save(self)
+        self.__class__.notify("save", self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        if not STORAGE.remove(self):
+            return
+        self.__class__.notify("remove", self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return STORAGE.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +205,51 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return objects ordered by ID, starting after the ID `after`
+        """
+        return STORAGE.page(cls, after, limit)
+
+    @classmethod
+    def iterate(cls, after: str = None, limit: int = None,
+                batch_size: int = 1000) -> Iterable[TypeVar('Base')]:
+        """ Yield objects ordered by ID, one page of `batch_size` at a time
+        so that objects created or removed meanwhile don't break the walk
+        """
+        while limit is None or limit > 0:
+            size = batch_size if limit is None else min(batch_size, limit)
+            objs = cls.page(after, size)
+            yield from objs
+            if len(objs) < size:
+                return
+            after = objs[-1].id
+            if limit is not None:
+                limit -= len(objs)
+
+    @classmethod
+    def store_version(cls) -> Tuple[str, int]:
+        """ Version of the stored objects of the class, changed by every
+        save() and remove(), and time of the last change; None if the
+        storage doesn't track it
+        """
+        return STORAGE.version(cls)
+
+    @property
+    def version(self) -> str:
+        """ Version of the object, changed by every save()
+        """
+        return STORAGE.object_version(self)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return STORAGE.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return STORAGE.search(cls, attributes)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+""" Storage backends of the models
+
+MODELS_STORAGE selects the backend:
+- "json" (default): every object in memory, persisted in .db_<Class>.json
+- "sqlite": one table per class in MODELS_SQLITE_PATH (default
+  .db.sqlite3), queried on demand
+"""
+from os import getenv
+from models.engine.storage import Storage
+
+
+def storage_from_env() -> Storage:
+    """ Build the storage selected by MODELS_STORAGE
+    """
+    kind = getenv("MODELS_STORAGE", "json")
+    if kind == "json":
+        from models.engine.file_storage import FileStorage
+        return FileStorage()
+    if kind == "sqlite":
+        from models.engine.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(getenv("MODELS_SQLITE_PATH", ".db.sqlite3"))
+    raise ValueError("unknown MODELS_STORAGE: {}".format(kind))
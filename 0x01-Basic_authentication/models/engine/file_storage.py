@@ -0,0 +1,962 @@
+#!/usr/bin/env python3
+""" File storage: every object is kept in memory and persisted in
+.db_<Class>.json, or .db_<Class>.bin in the binary format
+"""
+from bisect import bisect_left, bisect_right, insort
+from contextlib import ExitStack, contextmanager, nullcontext
+from itertools import chain
+from typing import TypeVar, List, Iterable, Tuple
+from os import getenv, path
+import gc
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+try:
+    import fcntl
+except ImportError:
+    # only the "shared" persistence needs it
+    fcntl = None
+
+from models.engine.storage import Storage
+from models.timestamps import format_epoch, to_epoch
+
+
+# "snapshot": every mutation rewrites .db_<Class>.json
+# "journal": mutations are appended to .db_<Class>.journal and compacted
+#            into the snapshot once the journal outgrows it
+# "write_behind": mutations only mark the class dirty, a background thread
+#                 rewrites the snapshot every FLUSH_INTERVAL_MS or after
+#                 FLUSH_MAX_PENDING mutations
+# "shared": "journal" for several processes using the same files: writes
+#           hold an fcntl lock on .db_<Class>.lock and every process
+#           applies the records appended by the others before reading
+PERSISTENCE = getenv("MODELS_PERSISTENCE", "snapshot")
+JOURNAL_MIN_BYTES = int(getenv("MODELS_JOURNAL_MIN_BYTES", 1 << 20))
+FLUSH_INTERVAL_MS = int(getenv("MODELS_FLUSH_INTERVAL_MS", 100))
+FLUSH_MAX_PENDING = int(getenv("MODELS_FLUSH_MAX_PENDING", 1000))
+# "json": snapshots are JSON objects of the serialized objects
+# "binary": snapshots are pickles (protocol SNAPSHOT_PROTOCOL) of one
+#           tuple per object, with timestamps in seconds since the epoch
+SNAPSHOT_FORMAT = getenv("MODELS_SNAPSHOT_FORMAT", "json")
+# lazy loading keeps the loaded records in RAW and only builds the
+# objects on their first access
+LAZY = getenv("MODELS_LAZY", "1") != "0"
+SNAPSHOT_VERSION = 1
+# pinned so that snapshots stay readable by every supported Python
+SNAPSHOT_PROTOCOL = 4
+DATA = {}
+RAW = {}
+SNAPSHOT_SIZES = {}
+DIRTY = {}
+# LOCK protects DATA and the indexes, WRITE_LOCK orders snapshot writes.
+# WRITE_LOCK is always acquired before LOCK
+LOCK = threading.RLock()
+WRITE_LOCK = threading.Lock()
+INDEXES = {}
+INDEXED_KEYS = {}
+SORTED_IDS = {}
+# (generation, offset, fingerprint) of the journal records applied in
+# memory, with the "shared" persistence
+JOURNAL_POSITIONS = {}
+# [epoch, counter, modified_at] of every class: the counter is bumped by
+# every object stored or dropped, the epoch changes at every load, and in
+# forked processes unless the persistence is "shared"
+VERSIONS = {}
+# counter of the class when each object was last stored, objects not
+# stored since the load have none
+OBJECT_VERSIONS = {}
+_UNHASHABLE = object()
+
+
+def _index_key(obj, fields: Tuple[str, ...]) -> tuple:
+    """ Build the key of an object for an index over `fields`
+    """
+    key = tuple(getattr(obj, field, None) for field in fields)
+    try:
+        hash(key)
+    except TypeError:
+        return _UNHASHABLE
+    return key
+
+
+def _hydrate(cls, raw) -> TypeVar('Base'):
+    """ Build an object from a raw record: a tuple of the values of
+    `__fields__` or a dict of the serialized object
+    """
+    if isinstance(raw, dict):
+        return cls(**raw)
+    return cls.from_row(raw)
+
+
+def _compact(record: dict, fields: Tuple[str, ...], keys: set):
+    """ Raw record of a serialized object: the tuple of its `fields`
+    values if they are its `keys`, else the dict itself
+    """
+    if record.keys() == keys:
+        return tuple(map(record.get, fields))
+    return record
+
+
+def _serialized(cls, raw) -> dict:
+    """ Serialized (JSON) form of a raw record
+    """
+    if isinstance(raw, dict):
+        return raw
+    record = dict(zip(cls.__fields__, raw))
+    for key in ('created_at', 'updated_at'):
+        if isinstance(record.get(key), int):
+            record[key] = format_epoch(record[key])
+    return record
+
+
+def _row(cls, raw):
+    """ Binary form of a raw record: timestamps in seconds since the epoch
+    """
+    if isinstance(raw, dict):
+        return raw
+    fields = cls.__fields__
+    return tuple(to_epoch(value) if isinstance(value, str) and
+                 fields[i] in ('created_at', 'updated_at') else value
+                 for i, value in enumerate(raw))
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """ Unpickler of binary snapshots: they only hold builtin containers
+    and scalars, any other object is refused
+    """
+
+    def find_class(self, module, name):
+        """ Refuse every global """
+        raise pickle.UnpicklingError(
+            "{}.{} is not allowed in a snapshot".format(module, name))
+
+
+def _load_binary(f) -> dict:
+    """ Read a binary snapshot from the file `f`
+    """
+    snapshot = _SnapshotUnpickler(f).load()
+    if snapshot.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError("snapshot version {} is not supported".format(
+            snapshot["version"]))
+    return snapshot
+
+
+@contextmanager
+def _gc_paused():
+    """ Disable the cyclic garbage collector while millions of objects
+    are allocated: each full collection would walk all of them
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _fingerprint(file_path: str) -> tuple:
+    """ Identity, size and modification time of a file, None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _journal_generation(journal_path: str) -> str:
+    """ Generation written in the first record of a journal, None if the
+    journal is missing or has none
+    """
+    try:
+        with open(journal_path, 'rb') as f:
+            record = json.loads(f.readline())
+    except (FileNotFoundError, ValueError):
+        return None
+    if not isinstance(record, dict) or record.get("op") != "begin":
+        return None
+    return record.get("generation")
+
+
+def _read_journal(journal_path: str, offset: int = 0) -> (list, int):
+    """ Complete records of a journal from the byte `offset`
+    Return:
+        the records and the offset after the last one
+    """
+    records = []
+    if not path.exists(journal_path):
+        return records, offset
+    with open(journal_path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # torn write at the end of the journal
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            offset += len(line)
+    return records, offset
+
+
+class _FileLock():
+    """ Exclusive fcntl lock on a file, reentrant within a thread; other
+    threads of the process are excluded too since each one opens the
+    file on its own
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize the lock, the file is created on first use
+        """
+        self.file_path = file_path
+        self._local = threading.local()
+
+    def __enter__(self):
+        """ Wait for the lock
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._local.fd = fd
+        self._local.depth = depth + 1
+
+    def __exit__(self, *exc):
+        """ Release the lock once the outermost block exits
+        """
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            # closing the file releases the lock
+            os.close(self._local.fd)
+
+
+def _index_fields(cls) -> List[Tuple[str, ...]]:
+    """ Normalized list of the indexes declared by a model class
+    """
+    return [(idx,) if isinstance(idx, str) else tuple(idx)
+            for idx in cls.__indexes__]
+
+
+class _Flusher(threading.Thread):
+    """ Background thread of the write_behind mode: coalesces the
+    mutations of dirty classes into a single snapshot write
+    """
+
+    def __init__(self, storage: "FileStorage"):
+        """ Initialize the flusher
+        """
+        super().__init__(name="models-flusher", daemon=True)
+        self.storage = storage
+        self.condition = threading.Condition()
+        self.pending = 0
+        self.stopped = False
+
+    def notify(self):
+        """ Count one mutation, wake up the thread if too many are pending
+        """
+        with self.condition:
+            self.pending += 1
+            if self.pending >= FLUSH_MAX_PENDING:
+                self.condition.notify()
+
+    def run(self):
+        """ Flush dirty classes until stopped
+        """
+        while not self.stopped:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.stopped or self.pending >= FLUSH_MAX_PENDING,
+                    timeout=FLUSH_INTERVAL_MS / 1000)
+                self.pending = 0
+            self.storage.flush()
+
+    def stop(self):
+        """ Stop the thread after a last flush
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.join()
+
+
+def _new_epochs():
+    """ Give a forked process its own epochs: unless the persistence is
+    "shared", its objects diverge from those of its parent and siblings,
+    which count their changes from the same versions
+    """
+    for version in VERSIONS.values():
+        version[0] = uuid.uuid4().hex[:8]
+
+
+if PERSISTENCE != "shared" and hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_new_epochs)
+
+
+class FileStorage(Storage):
+    """ Objects live in DATA, secondary indexes are dicts from the
+    indexed values to the IDs, and every class is persisted in its own
+    snapshot according to PERSISTENCE and SNAPSHOT_FORMAT.
+
+    With LAZY, loaded records stay in RAW until an object is accessed;
+    an ID is either in DATA or in RAW, never in both. Records in RAW are
+    indexed but their keys are not kept in INDEXED_KEYS: they are those
+    of the record itself.
+
+    With the "shared" persistence, every journal starts with a record of
+    its generation. A compaction renames the journal to
+    .db_<Class>.journal.previous and starts a new generation, so that
+    the other processes can still read the records they missed; they
+    reload everything only if they missed two compactions.
+    """
+
+    def __init__(self):
+        """ Initialize the storage, the flusher is started on first use
+        """
+        if PERSISTENCE == "shared" and fcntl is None:
+            raise ValueError("MODELS_PERSISTENCE=shared requires fcntl")
+        self._flusher = None
+        self._file_locks = {}
+        self._batch = threading.local()
+
+    def _locked(self, cls):
+        """ Context holding the lock of the files of `cls` shared by
+        the processes, a no-op unless PERSISTENCE is "shared"
+        """
+        if PERSISTENCE != "shared":
+            return nullcontext()
+        s_class = cls.__name__
+        lock = self._file_locks.get(s_class)
+        if lock is None:
+            lock = self._file_locks.setdefault(
+                s_class, _FileLock(".db_{}.lock".format(s_class)))
+        return lock
+
+    def _objects(self, cls) -> dict:
+        """ Objects of `cls` by ID
+        """
+        return DATA.setdefault(cls.__name__, {})
+
+    def _raw(self, cls) -> dict:
+        """ Records of `cls` not built yet, by ID
+        """
+        return RAW.setdefault(cls.__name__, {})
+
+    def _get(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Object by ID, built from its record if needed; LOCK must be
+        held unless the object was already built
+        """
+        obj = self._objects(cls).get(obj_id)
+        if obj is None:
+            raw = self._raw(cls).pop(obj_id, None)
+            if raw is not None:
+                obj = _hydrate(cls, raw)
+                DATA[cls.__name__][obj_id] = obj
+                self._index_keep(cls, obj)
+        return obj
+
+    def _hydrate_all(self, cls):
+        """ Build the objects of every remaining record
+        """
+        raws = RAW.pop(cls.__name__, {})
+        objs = self._objects(cls)
+        with _gc_paused():
+            for obj_id, raw in raws.items():
+                obj = objs[obj_id] = _hydrate(cls, raw)
+                self._index_keep(cls, obj)
+
+    def _put_record(self, cls, obj_id: str, record: dict):
+        """ Store a serialized object, built now unless LAZY
+        """
+        self._objects(cls).pop(obj_id, None)
+        if LAZY:
+            self._raw(cls)[obj_id] = _compact(
+                record, cls.__fields__, set(cls.__fields__))
+        else:
+            self._raw(cls).pop(obj_id, None)
+            DATA[cls.__name__][obj_id] = cls(**record)
+
+    def _read_snapshot(self, cls, file_path: str, binary: bool):
+        """ Load the records of a snapshot file
+        """
+        s_class = cls.__name__
+        fields = cls.__fields__
+        if binary:
+            with open(file_path, 'rb') as f:
+                snapshot = _load_binary(f)
+            rows = snapshot["rows"]
+            if tuple(snapshot["fields"]) != fields:
+                # the fields of the class changed since the dump
+                rows = [row if isinstance(row, dict)
+                        else dict(zip(snapshot["fields"], row))
+                        for row in rows]
+            if LAZY:
+                RAW[s_class] = {row["id"] if isinstance(row, dict)
+                                else row[0]: row for row in rows}
+            else:
+                for row in rows:
+                    obj = _hydrate(cls, row)
+                    DATA[s_class][obj.id] = obj
+            return
+        with open(file_path, 'r') as f:
+            objs_json = json.load(f)
+        if LAZY:
+            keys = set(fields)
+            RAW[s_class] = {obj_id: _compact(obj_json, fields, keys)
+                            for obj_id, obj_json in objs_json.items()}
+        else:
+            for obj_id, obj_json in objs_json.items():
+                DATA[s_class][obj_id] = cls(**obj_json)
+
+    def load(self, cls):
+        """ Load all objects of `cls` from its snapshot and journal
+
+        The snapshot in SNAPSHOT_FORMAT is read if it exists, else the
+        one in the other format. Indexes are rebuilt on the first search.
+        """
+        s_class = cls.__name__
+        json_path = ".db_{}.json".format(s_class)
+        binary_path = ".db_{}.bin".format(s_class)
+        candidates = [(binary_path, True), (json_path, False)]
+        journal_path = ".db_{}.journal".format(s_class)
+        if SNAPSHOT_FORMAT != "binary":
+            candidates.reverse()
+        with self._locked(cls):
+            with LOCK, _gc_paused():
+                JOURNAL_POSITIONS.pop(s_class, None)
+                DATA[s_class] = {}
+                RAW[s_class] = {}
+                SNAPSHOT_SIZES[s_class] = 0
+                for file_path, binary in candidates:
+                    if path.exists(file_path):
+                        self._read_snapshot(cls, file_path, binary)
+                        SNAPSHOT_SIZES[s_class] = path.getsize(file_path)
+                        break
+                # a compaction may have been interrupted before the
+                # journal was merged into the snapshot
+                self.replay_journal(
+                    cls, "{}.compacting".format(journal_path))
+                offset = self.replay_journal(cls, journal_path)
+                if PERSISTENCE == "journal" and path.exists(journal_path) \
+                        and path.getsize(journal_path) > offset:
+                    # drop a record torn by a crash while appending, the
+                    # next records would be appended to it
+                    os.truncate(journal_path, offset)
+                INDEXES.pop(s_class, None)
+                INDEXED_KEYS.pop(s_class, None)
+                SORTED_IDS.pop(s_class, None)
+                modified_at = [path.getmtime(file_path) for file_path in (
+                    json_path, binary_path, journal_path)
+                    if path.exists(file_path)]
+                VERSIONS[s_class] = [uuid.uuid4().hex[:8], 0, int(
+                    max(modified_at) if modified_at else time.time())]
+                OBJECT_VERSIONS[s_class] = {}
+            if PERSISTENCE == "shared":
+                generation = _journal_generation(journal_path)
+                if generation is None:
+                    # no journal yet, or one of the "journal" persistence
+                    self.dump(cls)
+                else:
+                    self._track_journal(cls, generation, offset)
+
+    def replay_journal(self, cls, journal_path: str) -> int:
+        """ Apply the records of a journal on top of the loaded snapshot
+        Return:
+            the offset after the last complete record
+        """
+        s_class = cls.__name__
+        records, offset = _read_journal(journal_path)
+        for record in records:
+            if record.get("op") == "save":
+                self._put_record(cls, record["id"], record["obj"])
+            elif record.get("op") == "remove":
+                DATA[s_class].pop(record["id"], None)
+                self._raw(cls).pop(record["id"], None)
+        return offset
+
+    def _start_journal(self, cls) -> Tuple[str, int]:
+        """ Create the journal of a new generation, with the "shared"
+        persistence
+        Return:
+            the generation and the size of the journal
+        """
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        generation = uuid.uuid4().hex
+        header = json.dumps({"op": "begin", "generation": generation})
+        tmp_path = "{}.tmp".format(journal_path)
+        with open(tmp_path, 'w') as f:
+            f.write(header + "\n")
+            size = f.tell()
+        os.replace(tmp_path, journal_path)
+        return generation, size
+
+    def _track_journal(self, cls, generation: str, offset: int):
+        """ Record the journal records applied in memory, dropping a
+        record torn by a process killed while appending; the lock of the
+        files must be held
+        """
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        if _fingerprint(journal_path)[1] > offset:
+            os.truncate(journal_path, offset)
+        JOURNAL_POSITIONS[cls.__name__] = (
+            generation, offset, _fingerprint(journal_path))
+
+    def sync(self, cls):
+        """ Apply the mutations appended by other processes to the journal
+        of `cls`, with the "shared" persistence
+
+        Checking for them costs one stat() of the journal.
+        """
+        if PERSISTENCE != "shared":
+            return
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        position = JOURNAL_POSITIONS.get(s_class)
+        if position is None or _fingerprint(journal_path) == position[2]:
+            return
+        events = []
+        with self._locked(cls):
+            generation, offset, _ = JOURNAL_POSITIONS[s_class]
+            previous_path = "{}.previous".format(journal_path)
+            current = _journal_generation(journal_path)
+            if current is not None and current == generation:
+                chunks = [(journal_path, offset)]
+            elif current is not None and \
+                    _journal_generation(previous_path) == generation:
+                # compacted once since the last sync
+                chunks = [(previous_path, offset), (journal_path, 0)]
+            else:
+                self.load(cls)
+                cls.notify("load", None)
+                return
+            with LOCK:
+                for file_path, start in chunks:
+                    records, offset = _read_journal(file_path, start)
+                    for record in records:
+                        if record.get("op") == "save":
+                            obj = cls(**record["obj"])
+                            self._store(cls, obj)
+                            events.append(("save", obj))
+                        elif record.get("op") == "remove":
+                            obj = self._unstore(cls, record["id"])
+                            if obj is not None:
+                                events.append(("remove", obj))
+                self._track_journal(cls, current, offset)
+        for event, obj in events:
+            cls.notify(event, obj)
+
+    def append_to_journal(self, cls,
+                          mutations: List[Tuple[str, TypeVar('Base')]]):
+        """ Append mutations, pairs of an operation and an object, to the
+        journal in a single write, compacting it into the snapshot once it
+        is bigger than the snapshot itself
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        lines = []
+        with LOCK:
+            for op, obj in mutations:
+                record = {"op": op, "id": obj.id}
+                if op == "save":
+                    record["obj"] = obj.to_json(True)
+                lines.append(json.dumps(record) + "\n")
+            with open(journal_path, 'a') as f:
+                f.write("".join(lines))
+                journal_size = f.tell()
+            if PERSISTENCE == "shared":
+                JOURNAL_POSITIONS[s_class] = (
+                    JOURNAL_POSITIONS[s_class][0], journal_size,
+                    _fingerprint(journal_path))
+        snapshot_size = SNAPSHOT_SIZES.get(s_class, 0)
+        if journal_size > max(JOURNAL_MIN_BYTES, snapshot_size):
+            cls.save_to_file()
+
+    @contextmanager
+    def batch(self):
+        """ Persist the mutations of the block at its end, per class: one
+        journal append, or one snapshot write
+
+        With the "shared" persistence, the lock of the files of a class
+        is held from its first mutation to the end of the block.
+        """
+        state = self._batch
+        if getattr(state, "pending", None) is not None:
+            # nested block: persisted by the outermost one
+            yield
+            return
+        state.pending = {}
+        with ExitStack() as state.locks:
+            try:
+                yield
+            finally:
+                pending, state.pending = state.pending, None
+                for cls, mutations in pending.values():
+                    if PERSISTENCE in ("journal", "shared"):
+                        self.append_to_journal(cls, mutations)
+                    else:
+                        # the other modes write the whole class anyway
+                        self.persist(cls, *mutations[-1])
+
+    def persist(self, cls, op: str, obj: TypeVar('Base')):
+        """ Persist a mutation ("save" or "remove") of `obj`
+        """
+        pending = getattr(self._batch, "pending", None)
+        if pending is not None:
+            if cls.__name__ not in pending:
+                pending[cls.__name__] = (cls, [])
+                self._batch.locks.enter_context(self._locked(cls))
+            pending[cls.__name__][1].append((op, obj))
+            return
+        if PERSISTENCE in ("journal", "shared"):
+            self.append_to_journal(cls, [(op, obj)])
+        elif PERSISTENCE == "write_behind":
+            with LOCK:
+                DIRTY[cls.__name__] = cls
+                if self._flusher is None:
+                    self._flusher = _Flusher(self)
+                    self._flusher.start()
+            self._flusher.notify()
+        else:
+            cls.save_to_file()
+
+    def reindex(self, cls):
+        """ Rebuild all secondary indexes from the loaded objects, and
+        from the records not built yet when they hold the indexed values
+        """
+        s_class = cls.__name__
+        with LOCK, _gc_paused():
+            index_fields = _index_fields(cls)
+            INDEXES[s_class] = {fields: {} for fields in index_fields}
+            INDEXED_KEYS[s_class] = {}
+            for obj in DATA.get(s_class, {}).values():
+                self._index_add(cls, obj)
+            raws = RAW.get(s_class)
+            if not raws:
+                return
+            positions = {field: i for i, field in enumerate(cls.__fields__)
+                         if field not in ('created_at', 'updated_at')}
+            indexed = [field for fields in index_fields for field in fields]
+            if not all(field in positions for field in indexed) or \
+                    any(isinstance(raw, dict) for raw in raws.values()):
+                self._hydrate_all(cls)
+                self.reindex(cls)
+                return
+            for fields, index in INDEXES[s_class].items():
+                field_positions = [positions[field] for field in fields]
+                for obj_id, raw in raws.items():
+                    key = tuple([raw[i] for i in field_positions])
+                    try:
+                        bucket = index.get(key)
+                    except TypeError:
+                        key = _UNHASHABLE
+                        bucket = index.get(key)
+                    if bucket is None:
+                        bucket = index[key] = {}
+                    bucket[obj_id] = True
+
+    def _index_add(self, cls, obj: TypeVar('Base')):
+        """ Add (or move) an object in the secondary indexes
+        """
+        s_class = cls.__name__
+        if s_class not in INDEXES:
+            self.reindex(cls)
+        self._index_remove(cls, obj.id)
+        keys = {}
+        for fields, index in INDEXES[s_class].items():
+            key = _index_key(obj, fields)
+            index.setdefault(key, {})[obj.id] = True
+            keys[fields] = key
+        INDEXED_KEYS[s_class][obj.id] = keys
+
+    def _index_keep(self, cls, obj: TypeVar('Base')):
+        """ Remember the keys of an object built from an indexed record
+        """
+        s_class = cls.__name__
+        if s_class in INDEXES:
+            INDEXED_KEYS[s_class][obj.id] = {
+                fields: _index_key(obj, fields)
+                for fields in INDEXES[s_class]}
+
+    def _index_remove(self, cls, obj_id: str, raw=None):
+        """ Remove an object, or the record `raw` of RAW, from the
+        secondary indexes
+        """
+        s_class = cls.__name__
+        keys = INDEXED_KEYS.get(s_class, {}).pop(obj_id, None)
+        if keys is None and raw is not None and s_class in INDEXES:
+            keys = {fields: _index_key(_hydrate(cls, raw), fields)
+                    for fields in INDEXES[s_class]}
+        if keys is None:
+            return
+        for fields, key in keys.items():
+            bucket = INDEXES[s_class][fields].get(key)
+            if bucket is None:
+                continue
+            bucket.pop(obj_id, None)
+            if len(bucket) == 0:
+                del INDEXES[s_class][fields][key]
+
+    def _index_candidates(self, cls, attributes: dict) -> Iterable[str]:
+        """ Return the IDs that may match `attributes` using the widest
+        usable index, or None if no index covers the search
+        """
+        s_class = cls.__name__
+        if s_class not in INDEXES:
+            self.reindex(cls)
+        usable = [fields for fields in INDEXES[s_class]
+                  if all(field in attributes for field in fields)]
+        if len(usable) == 0:
+            return None
+        fields = max(usable, key=len)
+        key = tuple(attributes[field] for field in fields)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        index = INDEXES[s_class][fields]
+        return list(index.get(key, {})) + list(index.get(_UNHASHABLE, {}))
+
+    def dump(self, cls):
+        """ Save all objects to file and truncate the journal
+        """
+        with self._locked(cls):
+            self.sync(cls)
+            self._dump(cls)
+
+    def _dump(self, cls):
+        """ Write the snapshot of `cls`; with the "shared" persistence the
+        journal is kept as the previous generation
+        """
+        s_class = cls.__name__
+        binary = SNAPSHOT_FORMAT == "binary"
+        file_path = ".db_{}.{}".format(s_class, "bin" if binary else "json")
+        other_path = ".db_{}.{}".format(s_class, "json" if binary else "bin")
+        journal_path = ".db_{}.journal".format(s_class)
+        compacting_path = "{}.compacting".format(journal_path)
+        with WRITE_LOCK:
+            with LOCK:
+                objs = self._objects(cls)
+                raws = self._raw(cls)
+                if binary:
+                    rows = [obj.to_row() if not getattr(obj, '__dict__', None)
+                            else obj.to_json(True) for obj in objs.values()]
+                    rows += [_row(cls, raw) for raw in raws.values()]
+                else:
+                    objs_json = {}
+                    for obj_id, obj in objs.items():
+                        objs_json[obj_id] = obj.to_json(True)
+                    for obj_id, raw in raws.items():
+                        objs_json[obj_id] = _serialized(cls, raw)
+                if path.exists(journal_path):
+                    os.replace(journal_path, compacting_path)
+
+            # the snapshot is written outside of LOCK so that mutations
+            # are not blocked by the disk
+            tmp_path = "{}.tmp".format(file_path)
+            if binary:
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump({"version": SNAPSHOT_VERSION,
+                                 "fields": cls.__fields__, "rows": rows},
+                                f, SNAPSHOT_PROTOCOL)
+                    SNAPSHOT_SIZES[s_class] = f.tell()
+            else:
+                with open(tmp_path, 'w') as f:
+                    json.dump(objs_json, f)
+                    SNAPSHOT_SIZES[s_class] = f.tell()
+            os.replace(tmp_path, file_path)
+            # the other format would be stale if loaded later: it is kept
+            # aside rather than deleted
+            if path.exists(other_path):
+                os.replace(other_path, "{}.bak".format(other_path))
+            if PERSISTENCE == "shared":
+                if path.exists(compacting_path):
+                    os.replace(compacting_path,
+                               "{}.previous".format(journal_path))
+                self._track_journal(cls, *self._start_journal(cls))
+            elif path.exists(compacting_path):
+                os.remove(compacting_path)
+
+    def _store(self, cls, obj: TypeVar('Base')):
+        """ Put `obj` in memory in place of its previous version, and in
+        the indexes and sorted IDs if they are built; LOCK must be held
+        """
+        s_class = cls.__name__
+        objs = self._objects(cls)
+        raw = self._raw(cls).pop(obj.id, None)
+        if raw is not None:
+            self._index_remove(cls, obj.id, raw)
+        elif obj.id not in objs and s_class in SORTED_IDS:
+            insort(SORTED_IDS[s_class], obj.id)
+        objs[obj.id] = obj
+        if s_class in INDEXES:
+            self._index_add(cls, obj)
+        OBJECT_VERSIONS.setdefault(s_class, {})[obj.id] = \
+            self._bump_version(cls)
+
+    def _unstore(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Drop an object from memory; LOCK must be held
+        Return:
+            the dropped object, None if it was not stored
+        """
+        s_class = cls.__name__
+        obj = self._objects(cls).pop(obj_id, None)
+        raw = self._raw(cls).pop(obj_id, None)
+        if obj is None and raw is None:
+            return None
+        self._index_remove(cls, obj_id, raw)
+        OBJECT_VERSIONS.get(s_class, {}).pop(obj_id, None)
+        self._bump_version(cls)
+        ids = SORTED_IDS.get(s_class)
+        if ids is not None:
+            i = bisect_left(ids, obj_id)
+            if i < len(ids) and ids[i] == obj_id:
+                del ids[i]
+        return obj if obj is not None else _hydrate(cls, raw)
+
+    def _version(self, cls) -> list:
+        """ [epoch, counter, modified_at] of `cls`; LOCK must be held
+        """
+        version = VERSIONS.get(cls.__name__)
+        if version is None:
+            version = VERSIONS[cls.__name__] = [
+                uuid.uuid4().hex[:8], 0, int(time.time())]
+        return version
+
+    def _bump_version(self, cls) -> int:
+        """ Count a change of the objects of `cls`; LOCK must be held
+        Return:
+            the new counter of the class
+        """
+        version = self._version(cls)
+        version[1] += 1
+        version[2] = int(time.time())
+        return version[1]
+
+    def version(self, cls) -> Tuple[str, int]:
+        """ Version of the objects of `cls` and time of their last change
+
+        Processes forked after the load apply the same mutations in the
+        same order with the "shared" persistence, so they agree on it.
+        """
+        self.sync(cls)
+        with LOCK:
+            epoch, counter, modified_at = self._version(cls)
+        return "{}.{}".format(epoch, counter), modified_at
+
+    def object_version(self, obj: TypeVar('Base')) -> str:
+        """ Version of `obj`: the version of its class when it was last
+        stored, or at the load. An object replaced in memory since it was
+        read (by sync()) has the digest of its fields instead
+        """
+        cls = obj.__class__
+        with LOCK:
+            if self._objects(cls).get(obj.id) is not obj:
+                return super().object_version(obj)
+            epoch = self._version(cls)[0]
+            counter = OBJECT_VERSIONS.get(cls.__name__, {}).get(obj.id, 0)
+        return "{}.{}".format(epoch, counter)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Store `obj` in memory and persist the mutation
+        """
+        cls = obj.__class__
+        with self._locked(cls):
+            self.sync(cls)
+            with LOCK:
+                self._store(cls, obj)
+            self.persist(cls, "save", obj)
+
+    def remove(self, obj: TypeVar('Base')) -> bool:
+        """ Drop `obj` from memory and persist the mutation
+        """
+        cls = obj.__class__
+        with self._locked(cls):
+            self.sync(cls)
+            with LOCK:
+                if self._unstore(cls, obj.id) is None:
+                    return False
+            self.persist(cls, "remove", obj)
+        return True
+
+    def count(self, cls) -> int:
+        """ Count all objects
+        """
+        self.sync(cls)
+        return len(self._objects(cls)) + len(RAW.get(cls.__name__, ()))
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        self.sync(cls)
+        obj = self._objects(cls).get(id)
+        if obj is None and id in RAW.get(cls.__name__, ()):
+            with LOCK:
+                obj = self._get(cls, id)
+        return obj
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+
+        Indexed attributes are matched against their value at the last
+        save(); every candidate is still compared attribute by attribute.
+        Searches no index covers build every object.
+        """
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        self.sync(cls)
+        with LOCK:
+            candidates = None
+            if len(attributes) > 0:
+                candidates = self._index_candidates(cls, attributes)
+            if candidates is not None:
+                objs = (self._get(cls, obj_id) for obj_id in candidates)
+                return list(filter(_search, (
+                    obj for obj in objs if obj is not None)))
+            self._hydrate_all(cls)
+            return list(filter(_search, self._objects(cls).values()))
+
+    def page(self, cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return objects ordered by ID, starting after the ID `after`
+        """
+        s_class = cls.__name__
+        self.sync(cls)
+        with LOCK:
+            if s_class not in SORTED_IDS:
+                SORTED_IDS[s_class] = sorted(chain(
+                    self._objects(cls), self._raw(cls)))
+            ids = SORTED_IDS[s_class]
+            start = 0 if after is None else bisect_right(ids, after)
+            end = len(ids) if limit is None else start + limit
+            return [self._get(cls, obj_id) for obj_id in ids[start:end]]
+
+    def flush(self):
+        """ Write the snapshot of every dirty class
+        """
+        with LOCK:
+            dirty = list(DIRTY.values())
+            DIRTY.clear()
+        for cls in dirty:
+            cls.save_to_file()
+
+    def close(self):
+        """ Stop the write_behind flusher and write pending mutations
+        """
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
+        self.flush()
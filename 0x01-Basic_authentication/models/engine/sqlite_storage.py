@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+""" SQLite storage: objects are queried on demand instead of being kept
+in memory
+"""
+from contextlib import contextmanager
+from typing import TypeVar, List, Tuple
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from models.engine.storage import Storage
+
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_SCALARS = (str, int, float)
+
+
+def _quote(name: str) -> str:
+    """ Quote a table or column name
+    """
+    if not _IDENTIFIER.match(name):
+        raise ValueError("invalid identifier: {}".format(name))
+    return '"{}"'.format(name)
+
+
+def _column_value(value):
+    """ Value of an indexed column: objects that SQLite can't compare
+    are stored as NULL and matched in Python
+    """
+    return value if value is None or isinstance(value, _SCALARS) else None
+
+
+class SQLiteStorage(Storage):
+    """ One table per class: the ID, a column per indexed attribute
+    (`__indexes__`, with a SQL index) and the JSON of the whole object.
+    The _versions table counts the changes of every class.
+
+    Every thread has its own connection in autocommit mode; the
+    database runs in WAL mode so that readers don't block the writer.
+    """
+
+    def __init__(self, database: str, timeout: float = 5.0):
+        """ Initialize the storage, connections are opened on first use
+        """
+        self.database = database
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database, timeout=self.timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _table(self, cls) -> Tuple[str, Tuple[str, ...]]:
+        """ Create the table of `cls` and its indexes if needed
+        Return:
+            the quoted table name and the indexed columns
+        """
+        s_class = cls.__name__
+        columns = self._columns.get(s_class)
+        if columns is not None:
+            return _quote(s_class), columns
+        indexes = [(idx,) if isinstance(idx, str) else tuple(idx)
+                   for idx in cls.__indexes__]
+        columns = tuple(sorted({field for fields in indexes
+                                for field in fields}))
+        table = _quote(s_class)
+        conn = self.connection
+        with self._lock:
+            conn.execute("CREATE TABLE IF NOT EXISTS _versions (name TEXT "
+                         "PRIMARY KEY, epoch TEXT NOT NULL, version INTEGER "
+                         "NOT NULL, modified_at INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY "
+                         "KEY, data TEXT NOT NULL)".format(table))
+            existing = {row[1] for row in conn.execute(
+                "PRAGMA table_info({})".format(table))}
+            added = [column for column in columns if column not in existing]
+            for column in added:
+                conn.execute("ALTER TABLE {} ADD COLUMN {}".format(
+                    table, _quote(column)))
+            if added:
+                # new indexes: fill their columns from the stored objects
+                rows = conn.execute("SELECT data FROM {}".format(table))
+                update = "UPDATE {} SET {} WHERE id = ?".format(
+                    table, ", ".join("{} = ?".format(_quote(column))
+                                     for column in added))
+                conn.executemany(update, [
+                    [_column_value(getattr(obj, column, None))
+                     for column in added] + [obj.id]
+                    for obj in self._hydrate(cls, rows.fetchall())])
+            for fields in indexes:
+                conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})"
+                             .format(_quote("ix_{}_{}".format(
+                                 s_class, "_".join(fields))), table,
+                                 ", ".join(_quote(f) for f in fields)))
+            self._columns[s_class] = columns
+        return table, columns
+
+    def _hydrate(self, cls, rows) -> List[TypeVar('Base')]:
+        """ Build the objects of rows of JSON data
+        """
+        return [cls(**json.loads(data)) for data, in rows]
+
+    def load(self, cls):
+        """ Create the table of `cls`, nothing is read
+        """
+        self._table(cls)
+
+    def dump(self, cls):
+        """ Nothing to do: every mutation is committed
+        """
+
+    def _bump_version(self, cls):
+        """ Count a change of the objects of `cls`, after the change so
+        that a version read is never newer than the rows read after it
+        """
+        self.connection.execute(
+            "INSERT INTO _versions VALUES (?, ?, 1, ?) ON CONFLICT(name) DO "
+            "UPDATE SET version = version + 1, modified_at = "
+            "excluded.modified_at",
+            (cls.__name__, uuid.uuid4().hex[:8], int(time.time())))
+
+    def version(self, cls) -> Tuple[str, int]:
+        """ Version of the objects of `cls` and time of their last change
+        """
+        self._table(cls)
+        row = self.connection.execute(
+            "SELECT epoch, version, modified_at FROM _versions WHERE name = ?",
+            (cls.__name__,)).fetchone()
+        if row is None:
+            return None
+        return "{}.{}".format(row[0], row[1]), row[2]
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or replace the row of `obj`
+        """
+        table, columns = self._table(obj.__class__)
+        names = ("id", "data") + columns
+        values = [obj.id, json.dumps(obj.to_json(True))]
+        values += [_column_value(getattr(obj, column, None))
+                   for column in columns]
+        self.connection.execute(
+            "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+                table, ", ".join(_quote(name) for name in names),
+                ", ".join("?" * len(names))), values)
+        self._bump_version(obj.__class__)
+
+    def remove(self, obj: TypeVar('Base')) -> bool:
+        """ Delete the row of `obj`
+        """
+        table, _ = self._table(obj.__class__)
+        cursor = self.connection.execute(
+            "DELETE FROM {} WHERE id = ?".format(table), (obj.id,))
+        if cursor.rowcount == 0:
+            return False
+        self._bump_version(obj.__class__)
+        return True
+
+    def count(self, cls) -> int:
+        """ Count all objects
+        """
+        table, _ = self._table(cls)
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        table, _ = self._table(cls)
+        rows = self.connection.execute(
+            "SELECT data FROM {} WHERE id = ?".format(table), (id,))
+        objs = self._hydrate(cls, rows)
+        return objs[0] if objs else None
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+
+        The ID, indexed columns and scalar attributes are matched in SQL;
+        the resulting objects are still compared attribute by attribute.
+        """
+        table, columns = self._table(cls)
+        clauses, params = [], []
+        for key, value in attributes.items():
+            if not _IDENTIFIER.match(key):
+                continue
+            if key == "id" or key in columns:
+                if value is None:
+                    clauses.append("{} IS NULL".format(_quote(key)))
+                elif isinstance(value, _SCALARS):
+                    clauses.append("{} = ?".format(_quote(key)))
+                    params.append(value)
+            elif isinstance(value, _SCALARS) and \
+                    key in getattr(cls, "__fields__", ()):
+                # other attributes (properties...) are not in the JSON
+                clauses.append("json_extract(data, ?) = ?")
+                params += ["$." + key, value]
+        query = "SELECT data FROM {}".format(table)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        objs = self._hydrate(cls, self.connection.execute(query, params))
+        return [obj for obj in objs
+                if all(getattr(obj, key) == value
+                       for key, value in attributes.items())]
+
+    def page(self, cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return objects ordered by ID, starting after the ID `after`
+        """
+        table, _ = self._table(cls)
+        query = "SELECT data FROM {} WHERE id > ? ORDER BY id LIMIT ?".format(
+            table)
+        rows = self.connection.execute(
+            query, ("" if after is None else after,
+                    -1 if limit is None else limit))
+        return self._hydrate(cls, rows)
+
+    @contextmanager
+    def batch(self):
+        """ Run the mutations of the block in one transaction of the
+        connection of the current thread, committed at its end
+        """
+        conn = self.connection
+        if conn.in_transaction:
+            yield
+            return
+        conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            conn.execute("COMMIT")
+
+    def close(self):
+        """ Close the connections of every thread
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._columns = {}
+        self._local = threading.local()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Storage interface of the models
+"""
+from contextlib import contextmanager
+from typing import TypeVar, List, Tuple
+import hashlib
+
+
+class Storage():
+    """ Storage backend of Base: every method receives the model class
+    (or object) so that one storage serves all the models
+    """
+
+    def load(self, cls):
+        """ Make the objects of `cls` available
+        """
+        raise NotImplementedError
+
+    def dump(self, cls):
+        """ Write the objects of `cls` to durable storage
+        """
+        raise NotImplementedError
+
+    def sync(self, cls):
+        """ Apply the changes made to `cls` by other processes
+        """
+
+    def reindex(self, cls):
+        """ Rebuild the secondary indexes of `cls`
+        """
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update `obj`
+        """
+        raise NotImplementedError
+
+    def remove(self, obj: TypeVar('Base')) -> bool:
+        """ Delete `obj`, return False if it was not stored
+        """
+        raise NotImplementedError
+
+    def count(self, cls) -> int:
+        """ Number of objects of `cls`
+        """
+        raise NotImplementedError
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Object of `cls` with the ID `id`, or None
+        """
+        raise NotImplementedError
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects of `cls` whose attributes equal `attributes`
+        """
+        raise NotImplementedError
+
+    def page(self, cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Objects of `cls` ordered by ID, starting after the ID `after`
+        """
+        raise NotImplementedError
+
+    def version(self, cls) -> Tuple[str, int]:
+        """ Version of the objects of `cls`, changed by every save() and
+        remove(), and time of the last change (seconds since the epoch);
+        None if not tracked
+        """
+        return None
+
+    def object_version(self, obj: TypeVar('Base')) -> str:
+        """ Version of `obj`, changed by every save(): a digest of its
+        fields unless the storage tracks versions
+        """
+        return hashlib.blake2b(repr(obj.to_row()).encode(),
+                               digest_size=8).hexdigest()
+
+    @contextmanager
+    def batch(self):
+        """ Persist the mutations made in the block with as few writes as
+        possible, at its end (even if it raises)
+        """
+        yield
+
+    def flush(self):
+        """ Write pending mutations
+        """
+
+    def close(self):
+        """ Write pending mutations and release resources
+        """
+        self.flush()
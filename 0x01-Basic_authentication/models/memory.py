@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+""" Memory accounting of the objects held by the JSON storage
+"""
+from types import FunctionType, ModuleType
+from typing import Dict, Iterable
+import gc
+import sys
+
+from models.engine.file_storage import DATA, RAW
+
+
+_SHARED = (type, ModuleType, FunctionType)
+
+
+def deep_sizeof(obj, seen: set = None) -> int:
+    """ Bytes of `obj` and of every object it references, each object
+    being counted once across the calls sharing `seen`. Classes,
+    modules and functions are shared by all objects and not counted
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SHARED):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        stack.extend(gc.get_referents(current))
+    return size
+
+
+def memory_report(classes: Iterable[str] = None) -> Dict[str, dict]:
+    """ Bytes used by the objects of each class in DATA and by its records
+    not built yet in RAW, including the dicts holding them; strings
+    shared by several objects of a class (interned names) are counted once
+    Return:
+        {class name: {"objects", "records", "bytes", "bytes_per_object"}}
+    """
+    report = {}
+    for s_class in classes or sorted(set(DATA) | set(RAW)):
+        objs = DATA.get(s_class, {})
+        raws = RAW.get(s_class, {})
+        seen = set()
+        total = sys.getsizeof(objs) + sys.getsizeof(raws)
+        for items in (objs, raws):
+            for obj_id, obj in list(items.items()):
+                total += deep_sizeof(obj_id, seen) + deep_sizeof(obj, seen)
+        count = len(objs) + len(raws)
+        report[s_class] = {
+            "objects": len(objs),
+            "records": len(raws),
+            "bytes": total,
+            "bytes_per_object": total / count if count else 0}
+    return report
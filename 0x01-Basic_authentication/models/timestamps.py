@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+""" Timestamps of the models: integer seconds since the epoch, serialized
+in TIMESTAMP_FORMAT
+"""
+from datetime import datetime, timedelta
+import calendar
+import time
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+def to_epoch(value) -> int:
+    """ Seconds since the epoch of a naive UTC datetime, a timestamp
+    string in TIMESTAMP_FORMAT or a number of seconds
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        # fromisoformat is much faster than strptime for this format
+        if len(value) == 19 and value[10] == 'T':
+            return (datetime.fromisoformat(value) - EPOCH) // _SECOND
+        return calendar.timegm(time.strptime(value, TIMESTAMP_FORMAT))
+    return calendar.timegm(value.utctimetuple())
+
+
+def from_epoch(seconds: int) -> datetime:
+    """ Naive UTC datetime of seconds since the epoch
+    """
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def format_epoch(seconds: int) -> str:
+    """ Seconds since the epoch in TIMESTAMP_FORMAT
+    """
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
@@ -2,13 +2,28 @@
 """ User module
 """
 import hashlib
+import sys
 from models.base import Base
 
 
+def _intern(value):
+    """ Share equal strings between users (names repeat a lot)
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
 class User(Base):
     """ User class
+
+    The password hash is kept as the 32 bytes of the SHA256 digest and
+    exposed as its hexadecimal form; first and last names are interned.
     """
 
+    __slots__ = ('email', '_digest', '_first_name', '_last_name')
+    __fields__ = Base.__fields__ + ('email', '_password', 'first_name',
+                                    'last_name')
+    __indexes__ = ('email',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -18,6 +33,43 @@ class User(Base):
         self.first_name = kwargs.get('first_name')
         self.last_name = kwargs.get('last_name')
 
+    @property
+    def _password(self) -> str:
+        """ Hexadecimal SHA256 of the password, as serialized
+        """
+        return None if self._digest is None else self._digest.hex()
+
+    @_password.setter
+    def _password(self, hexdigest: str):
+        """ Store a hexadecimal SHA256 as bytes
+        """
+        self._digest = None if hexdigest is None \
+            else bytes.fromhex(hexdigest)
+
+    @property
+    def first_name(self) -> str:
+        """ Getter of the first name
+        """
+        return self._first_name
+
+    @first_name.setter
+    def first_name(self, value: str):
+        """ Setter of the first name, interned
+        """
+        self._first_name = _intern(value)
+
+    @property
+    def last_name(self) -> str:
+        """ Getter of the last name
+        """
+        return self._last_name
+
+    @last_name.setter
+    def last_name(self, value: str):
+        """ Setter of the last name, interned
+        """
+        self._last_name = _intern(value)
+
     @property
     def password(self) -> str:
         """ Getter of the password
@@ -38,10 +90,10 @@ class User(Base):
         """
         if pwd is None or type(pwd) is not str:
             return False
-        if self.password is None:
+        if self._digest is None:
             return False
         pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        return hashlib.sha256(pwd_e).digest() == self._digest
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+""" Tests of Auth.require_auth and BasicAuth.current_user
+"""
+import unittest
+
+from api.v1.auth.auth import Auth
+from test_metrics import run
+
+
+PASSWORD_CHANGED_ELSEWHERE = """
+import base64
+from api.v1.app import app
+from models.engine.sqlite_storage import SQLiteStorage
+from models.user import User
+User.load_from_file()
+user = User(email="bob@example.com")
+user.password = "old"
+user.save()
+client = app.test_client()
+header = {"Authorization": "Basic " + base64.b64encode(
+    b"bob@example.com:old").decode()}
+statuses = [client.get("/api/v1/users", headers=header).status_code]
+# another worker, with its own connection, changes the password
+other = User(**user.to_json(True))
+other.password = "new"
+SQLiteStorage(".db.sqlite3").save(other)
+statuses.append(client.get("/api/v1/users", headers=header).status_code)
+print(statuses)
+"""
+
+
+class TestRequireAuth(unittest.TestCase):
+    """ Excluded paths of Auth.require_auth
+    """
+
+    def test_list_changed_in_place(self):
+        """ Paths added to or removed from the same list are seen """
+        auth = Auth()
+        excluded = ['/api/v1/status/']
+        self.assertTrue(auth.require_auth('/api/v1/users', excluded))
+        excluded.append('/api/v1/users/')
+        self.assertFalse(auth.require_auth('/api/v1/users', excluded))
+        excluded.pop()
+        self.assertTrue(auth.require_auth('/api/v1/users', excluded))
+
+    def test_tuples(self):
+        """ Each tuple of excluded paths gets its own matcher """
+        auth = Auth()
+        self.assertFalse(auth.require_auth('/a', ('/a',)))
+        self.assertTrue(auth.require_auth('/a', ('/b',)))
+        self.assertFalse(auth.require_auth('/b', ('/b',)))
+
+    def test_wildcard(self):
+        """ `*` matches any sequence of characters """
+        auth = Auth()
+        self.assertFalse(auth.require_auth('/api/v1/status/',
+                                           ['/api/v1/stat*']))
+        self.assertTrue(auth.require_auth('/api/v1/users', ['/api/v1/stat*']))
+
+
+class TestCredentialCache(unittest.TestCase):
+    """ Cached Authorization headers of BasicAuth
+    """
+
+    def test_password_changed_by_another_process(self):
+        """ A cached header is rejected once its password changed """
+        self.assertEqual(run(PASSWORD_CHANGED_ELSEWHERE,
+                             AUTH_TYPE="basic_auth",
+                             MODELS_STORAGE="sqlite"), "[200, 403]\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
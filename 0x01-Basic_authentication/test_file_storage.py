@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+""" Tests of the JSON storage
+
+The persistence is configured by environment variables read at import
+time, so each test runs in a new process and a temporary directory.
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from test_metrics import run
+
+
+FORKED_VERSIONS = """
+import json, os
+from models.user import User
+User.load_from_file()
+user = User(email="bob@example.com")
+user.save()
+read_r, write_w = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.write(write_w, json.dumps(
+        [User.store_version()[0], user.version]).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+print(json.dumps({"parent": [User.store_version()[0], user.version],
+                  "child": json.loads(os.read(read_r, 4096))}))
+"""
+
+WRITE = """
+from models.user import User
+User.load_from_file()
+users = [User(email="user{}@example.com".format(i)) for i in range(3)]
+for user in users:
+    user.save()
+users[0].remove()
+"""
+
+SAVE_ONE = """
+from models.user import User
+User.load_from_file()
+User(email="bob@example.com").save()
+"""
+
+COMPACT = """
+from models.user import User
+User.load_from_file()
+User.save_to_file()
+"""
+
+EMAILS = """
+import json
+from models.user import User
+User.load_from_file()
+print(json.dumps(sorted(user.email for user in User.all())))
+"""
+
+WRITE_BEHIND = """
+import json, os
+from models import base
+from models.user import User
+User.load_from_file()
+User(email="bob@example.com").save()
+written = os.path.exists(".db_User.json")
+base.flush()
+with open(".db_User.json") as f:
+    emails = [obj["email"] for obj in json.load(f).values()]
+print(json.dumps([written, emails]))
+"""
+
+SEARCH = """
+import json
+from models.engine.file_storage import RAW
+from models.user import User
+User.load_from_file()
+found = [user.email for user in User.search({"email": "user1@example.com"})]
+unbuilt = len(RAW.get("User", {}))
+user = User.search({"email": "user2@example.com"})[0]
+user.email = "renamed@example.com"
+user.save()
+renamed = User.search({"email": "renamed@example.com"})
+User.search({"email": "user1@example.com"})[0].remove()
+print(json.dumps({
+    "found": found, "unbuilt": unbuilt,
+    "old": len(User.search({"email": "user2@example.com"})),
+    "renamed": [obj.id for obj in renamed] == [user.id],
+    "removed": len(User.search({"email": "user1@example.com"})),
+    "count": User.count()}))
+"""
+
+BATCH = """
+import builtins, json
+from models.engine import file_storage
+from models.user import User
+User.load_from_file()
+opened = []
+def counting_open(file, *args, **kwargs):
+    opened.append(file)
+    return builtins.open(file, *args, **kwargs)
+file_storage.open = counting_open
+with User.batch():
+    for i in range(5):
+        User(email="user{}@example.com".format(i)).save()
+print(json.dumps(opened))
+"""
+
+COMPACTED_BY_CHILD = """
+import json, os
+from models.user import User
+User.load_from_file()
+User(email="bob@example.com").save()
+events = []
+User.subscribe(lambda event, obj: events.append(event))
+pid = os.fork()
+if pid == 0:
+    for i in range(int(os.environ["COMPACTIONS"])):
+        User(email="user{}@example.com".format(i)).save()
+        User.save_to_file()
+    User(email="last@example.com").save()
+    os._exit(0)
+os.waitpid(pid, 0)
+emails = sorted(user.email for user in User.all())
+print(json.dumps({"events": events, "emails": emails}))
+"""
+
+TORN_BY_OTHER = """
+import json, os
+from models.user import User
+User.load_from_file()
+User(email="bob@example.com").save()
+size = os.path.getsize(".db_User.journal")
+with open(".db_User.journal", "a") as f:
+    f.write('{"op": "save", "id": "torn", "obj": {"ema')
+User.count()
+truncated = os.path.getsize(".db_User.journal") == size
+User(email="alice@example.com").save()
+print(json.dumps(truncated))
+"""
+
+CONCURRENT_WRITERS = """
+import json, os
+from models.user import User
+User.load_from_file()
+workers, saves = 4, 133
+pids = []
+for worker in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        for i in range(saves):
+            User(email="w{}-{}@example.com".format(worker, i)).save()
+        os._exit(0)
+    pids.append(pid)
+for pid in pids:
+    os.waitpid(pid, 0)
+seen = User.count()
+User.load_from_file()
+print(json.dumps({"seen": seen, "stored": User.count()}))
+"""
+
+REMAINING = ["user1@example.com", "user2@example.com"]
+
+
+class StorageTestCase(unittest.TestCase):
+    """ Scripts run one after the other in the same directory, as
+    restarts of the application
+    """
+
+    persistence = "journal"
+
+    def setUp(self):
+        """ Create the directory of the files
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def run_script(self, script: str, **env: str):
+        """ Output of a script run in the directory, decoded from JSON
+        """
+        env.setdefault("MODELS_PERSISTENCE", self.persistence)
+        output = run(script, self.directory, **env)
+        return json.loads(output) if output else None
+
+    def path(self, name: str) -> str:
+        """ Path of a file of the directory """
+        return os.path.join(self.directory, name)
+
+
+class TestJournal(StorageTestCase):
+    """ Journal replayed at the load
+    """
+
+    def test_replay(self):
+        """ Saves and removes are replayed after a restart """
+        self.run_script(WRITE)
+        self.assertFalse(os.path.exists(self.path(".db_User.json")))
+        self.assertEqual(self.run_script(EMAILS), REMAINING)
+
+    def test_torn_record(self):
+        """ A record torn by a crash is ignored, and dropped before the
+        next append """
+        self.run_script(WRITE)
+        with open(self.path(".db_User.journal"), "a") as f:
+            f.write('{"op": "save", "id": "torn", "obj": {"ema')
+        self.assertEqual(self.run_script(EMAILS), REMAINING)
+        self.run_script(SAVE_ONE)
+        self.assertEqual(self.run_script(EMAILS),
+                         ["bob@example.com"] + REMAINING)
+
+    def test_interrupted_compaction(self):
+        """ A journal renamed for a compaction whose snapshot was not
+        written is replayed, then merged by the next compaction """
+        self.run_script(SAVE_ONE)
+        self.run_script(COMPACT)
+        self.run_script(WRITE)
+        os.replace(self.path(".db_User.journal"),
+                   self.path(".db_User.journal.compacting"))
+        expected = ["bob@example.com"] + REMAINING
+        self.assertEqual(self.run_script(EMAILS), expected)
+        self.run_script(COMPACT)
+        self.assertEqual(os.listdir(self.directory), [".db_User.json"])
+        self.assertEqual(self.run_script(EMAILS), expected)
+
+
+class TestWriteBehind(StorageTestCase):
+    """ Snapshot written by flush() in the write_behind mode
+    """
+
+    persistence = "write_behind"
+
+    def test_flush(self):
+        """ Saves are written by flush(), not before """
+        written, emails = self.run_script(
+            WRITE_BEHIND, MODELS_FLUSH_INTERVAL_MS="60000")
+        self.assertFalse(written)
+        self.assertEqual(emails, ["bob@example.com"])
+
+
+class TestIndexes(StorageTestCase):
+    """ Searches by the indexed email after a load
+    """
+
+    persistence = "snapshot"
+
+    def search(self, lazy: str) -> dict:
+        """ Result of SEARCH on the users of WRITE """
+        self.run_script(WRITE)
+        return self.run_script(SEARCH, MODELS_LAZY=lazy)
+
+    def assertConsistent(self, result: dict):
+        """ Saves and removes moved the users in the index """
+        self.assertEqual(result["found"], ["user1@example.com"])
+        self.assertEqual(result["old"], 0)
+        self.assertTrue(result["renamed"])
+        self.assertEqual(result["removed"], 0)
+        self.assertEqual(result["count"], 1)
+
+    def test_lazy(self):
+        """ A lazy search only builds the users it finds """
+        result = self.search("1")
+        self.assertEqual(result["unbuilt"], 1)
+        self.assertConsistent(result)
+
+    def test_eager(self):
+        """ Every user is built at the load """
+        result = self.search("0")
+        self.assertEqual(result["unbuilt"], 0)
+        self.assertConsistent(result)
+
+
+class TestBatch(StorageTestCase):
+    """ Mutations of a batch persisted together
+    """
+
+    def test_journal(self):
+        """ One journal append for the batch """
+        self.assertEqual(self.run_script(BATCH), [".db_User.journal"])
+        self.assertEqual(len(self.run_script(EMAILS)), 5)
+
+    def test_snapshot(self):
+        """ One snapshot write for the batch """
+        self.assertEqual(self.run_script(
+            BATCH, MODELS_PERSISTENCE="snapshot"), [".db_User.json.tmp"])
+        self.assertEqual(len(self.run_script(EMAILS)), 5)
+
+
+class TestSharedJournal(StorageTestCase):
+    """ Records of the other processes applied by sync()
+    """
+
+    persistence = "shared"
+
+    def compacted_by_child(self, compactions: int) -> dict:
+        """ Events and users of a parent after a child compacted """
+        return self.run_script(COMPACTED_BY_CHILD,
+                               COMPACTIONS=str(compactions))
+
+    def test_one_compaction(self):
+        """ The records missed are read from the previous journal """
+        result = self.compacted_by_child(1)
+        self.assertEqual(result["events"], ["save", "save"])
+        self.assertEqual(result["emails"], [
+            "bob@example.com", "last@example.com", "user0@example.com"])
+
+    def test_two_compactions(self):
+        """ Everything is reloaded once the previous journal is gone """
+        result = self.compacted_by_child(2)
+        self.assertEqual(result["events"], ["load"])
+        self.assertEqual(result["emails"], [
+            "bob@example.com", "last@example.com", "user0@example.com",
+            "user1@example.com"])
+
+    def test_torn_record(self):
+        """ A record torn by another process is truncated before the
+        next append """
+        self.assertTrue(self.run_script(TORN_BY_OTHER))
+        self.assertEqual(self.run_script(EMAILS),
+                         ["alice@example.com", "bob@example.com"])
+
+    def test_concurrent_writers(self):
+        """ Saves of forked writers compacting the journal are all kept
+        """
+        result = self.run_script(CONCURRENT_WRITERS,
+                                 MODELS_JOURNAL_MIN_BYTES="16384")
+        self.assertEqual(result, {"seen": 532, "stored": 532})
+        self.assertTrue(os.path.exists(
+            self.path(".db_User.journal.previous")))
+
+
+class TestForkedVersions(unittest.TestCase):
+    """ ETags of processes forked after the load
+    """
+
+    def versions(self, persistence: str) -> dict:
+        """ Versions of the store and of a user in a parent and a child
+        """
+        return json.loads(run(FORKED_VERSIONS,
+                              MODELS_PERSISTENCE=persistence))
+
+    def test_private_persistence(self):
+        """ Processes that don't share their writes have their own
+        versions """
+        for persistence in ("snapshot", "journal", "write_behind"):
+            versions = self.versions(persistence)
+            self.assertNotEqual(versions["parent"][0], versions["child"][0])
+            self.assertNotEqual(versions["parent"][1], versions["child"][1])
+
+    def test_shared_persistence(self):
+        """ Processes sharing their writes agree on the versions """
+        versions = self.versions("shared")
+        self.assertEqual(versions["parent"], versions["child"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" Tests of the metrics of the API
+
+The storage is configured by environment variables read at import time,
+so each test imports the app in a new process and a temporary directory.
+"""
+from contextlib import ExitStack
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+SAVE = """
+from api.v1.app import app
+from models.user import User
+User.load_from_file()
+User(email="bob@example.com").save()
+print(app.test_client().get("/api/v1/metrics").get_data(as_text=True))
+"""
+
+STATUS = """
+from api.v1.app import app
+print(app.test_client().get("/api/v1/metrics").status_code)
+"""
+
+
+def run(script: str, directory: str = None, **env: str) -> str:
+    """ Output of a script run in a new process, in `directory` or in a
+    new temporary directory
+    """
+    base = dict(os.environ)
+    for name in ("AUTH_TYPE", "METRICS_PUBLIC"):
+        base.pop(name, None)
+    env = dict(base, PYTHONPATH=os.path.dirname(
+        os.path.abspath(__file__)), **env)
+    with ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        return subprocess.run(
+            [sys.executable, "-c", script], cwd=directory, env=env,
+            check=True, capture_output=True, text=True).stdout
+
+
+class TestStoreMetrics(unittest.TestCase):
+    """ store_operation_seconds covers the active storage backend
+    """
+
+    def assertSaveTimed(self, output: str):
+        """ The metrics show one timed save """
+        self.assertIn('store_operation_seconds_count{operation="save"} 1\n',
+                      output)
+
+    def test_journal_save(self):
+        """ A save appended to the journal is timed """
+        self.assertSaveTimed(run(SAVE, MODELS_STORAGE="json",
+                                 MODELS_PERSISTENCE="journal"))
+
+    def test_sqlite_save(self):
+        """ A save to SQLite is timed """
+        self.assertSaveTimed(run(SAVE, MODELS_STORAGE="sqlite"))
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """ Authentication of /api/v1/metrics
+    """
+
+    def test_requires_authentication(self):
+        """ The metrics are private by default """
+        self.assertEqual(run(STATUS, AUTH_TYPE="basic_auth"), "401\n")
+
+    def test_public(self):
+        """ METRICS_PUBLIC=1 serves them without authentication """
+        self.assertEqual(run(STATUS, AUTH_TYPE="basic_auth",
+                             METRICS_PUBLIC="1"), "200\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
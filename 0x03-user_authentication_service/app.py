@@ -1,13 +1,46 @@
 #!/usr/bin/env python3
 """Basic Flask app"""
-from flask import Flask, jsonify, request, abort, redirect
+from flask import (Flask, jsonify, request, abort, redirect, Response,
+                   stream_with_context)
 from auth import Auth
+from bcrypt_executor import Overloaded
+from bulk import read_records
+from metrics import METRICS, instrument_app
+import hmac
+import io
+import os
 
 
 AUTH = Auth()
 
 
+def require_admin():
+    token = os.getenv("ADMIN_TOKEN")
+    given = request.headers.get("X-Admin-Token", "")
+    if not token or not hmac.compare_digest(given, token):
+        abort(403)
+
+
+def require_metrics_access():
+    """Metrics are for administrators unless METRICS_PUBLIC=1"""
+    if os.getenv("METRICS_PUBLIC") != "1":
+        require_admin()
+
+
 app = Flask(__name__)
+instrument_app(app, guard=require_metrics_access)
+METRICS.gauge("bcrypt_pending", lambda: AUTH.bcrypt_stats()["pending"],
+              "bcrypt calls queued or running")
+
+
+@app.teardown_appcontext
+def end_request(exception=None):
+    AUTH.end_request()
+
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    return jsonify({"message": "too many pending logins"}), 503
 
 
 @app.route("/", methods=["GET"])
@@ -82,9 +115,32 @@ def update_password():
     try:
         AUTH.update_password(reset_token, new_password)
         return jsonify({"email": email, "message": "Password updated"}), 200
+    except Overloaded:
+        raise
     except Exception:
         abort(403)
 
 
+@app.route("/metrics/bcrypt", methods=["GET"], strict_slashes=False)
+def bcrypt_metrics():
+    require_metrics_access()
+    return jsonify(AUTH.bcrypt_stats()), 200
+
+
+@app.route("/admin/users/import", methods=["POST"], strict_slashes=False)
+def import_users():
+    require_admin()
+    fmt = "csv" if request.mimetype == "text/csv" else "ndjson"
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    return jsonify(AUTH.import_users(read_records(stream, fmt))), 200
+
+
+@app.route("/admin/users/export", methods=["GET"], strict_slashes=False)
+def export_users():
+    require_admin()
+    return Response(stream_with_context(AUTH.export_users()),
+                    mimetype="application/x-ndjson")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port="5000")
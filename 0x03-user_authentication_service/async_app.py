@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""ASGI app exposing the same routes as app.py
+
+Run it with any ASGI server, e.g.:
+    $ uvicorn async_app:app --port 5001
+
+Request bodies longer than MAX_CONTENT_LENGTH bytes (default 64 KiB) are
+rejected with 413.
+"""
+from http.cookies import SimpleCookie
+from typing import Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl
+import hmac
+import json
+import os
+
+from async_auth import AsyncAuth
+from bcrypt_executor import Overloaded
+
+
+AUTH = AsyncAuth()
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 64 * 1024))
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds MAX_CONTENT_LENGTH"""
+
+
+class Request:
+    """HTTP request: form fields, cookies and headers"""
+
+    def __init__(self, scope: dict, body: bytes) -> None:
+        self.method = scope["method"]
+        self.path = scope["path"]
+        headers = dict(scope["headers"])
+        self.headers = {key.decode("latin-1").lower():
+                        value.decode("latin-1")
+                        for key, value in headers.items()}
+        self.form = dict(parse_qsl(body.decode("latin-1")))
+        cookie = SimpleCookie(headers.get(b"cookie", b"").decode("latin-1"))
+        self.cookies = {key: morsel.value for key, morsel in cookie.items()}
+
+
+Response = Tuple[int, dict, List[Tuple[bytes, bytes]]]
+
+
+def jsonify(payload: dict, status: int = 200,
+            headers: List[Tuple[bytes, bytes]] = None) -> Response:
+    """JSON response"""
+    return status, payload, headers or []
+
+
+def abort(status: int) -> Response:
+    """Error response"""
+    messages = {401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large",
+                503: "Service Unavailable"}
+    return jsonify({"message": messages[status]}, status)
+
+
+def redirect(location: str) -> Response:
+    """Redirection response"""
+    return 302, {}, [(b"location", location.encode("latin-1"))]
+
+
+ROUTES: Dict[Tuple[str, str], Callable[[Request], Awaitable[Response]]] = {}
+
+
+def route(path: str, method: str):
+    """Register a handler for a method on a path"""
+    def register(handler):
+        ROUTES[(method, path)] = handler
+        return handler
+    return register
+
+
+def metrics_allowed(request: Request) -> bool:
+    """Metrics are for administrators unless METRICS_PUBLIC=1"""
+    if os.getenv("METRICS_PUBLIC") == "1":
+        return True
+    token = os.getenv("ADMIN_TOKEN")
+    given = request.headers.get("x-admin-token", "")
+    return bool(token) and hmac.compare_digest(given, token)
+
+
+@route("/", "GET")
+async def home(request: Request) -> Response:
+    return jsonify({"message": "Bienvenue"})
+
+
+@route("/users", "POST")
+async def users(request: Request) -> Response:
+    email = request.form.get("email")
+    password = request.form.get("password")
+    try:
+        user = await AUTH.register_user(email, password)
+        return jsonify({"email": user.email, "message": "user created"})
+    except ValueError:
+        return jsonify({"message": "email already registered"}, 400)
+
+
+@route("/sessions", "POST")
+async def login(request: Request) -> Response:
+    email = request.form.get("email")
+    password = request.form.get("password")
+    if not await AUTH.valid_login(email, password):
+        return abort(401)
+    session_id = await AUTH.create_session(email)
+    cookie = f"session_id={session_id}; Path=/".encode("latin-1")
+    return jsonify({"email": f"{email}", "message": "logged in"},
+                   headers=[(b"set-cookie", cookie)])
+
+
+@route("/sessions", "DELETE")
+async def logout(request: Request) -> Response:
+    session_id = request.cookies.get("session_id")
+    if session_id:
+        user = await AUTH.get_user_from_session_id(session_id)
+        if user:
+            await AUTH.destroy_session(user.id)
+            return redirect("/")
+    return abort(403)
+
+
+@route("/profile", "GET")
+async def profile(request: Request) -> Response:
+    session_id = request.cookies.get("session_id")
+    user = await AUTH.get_user_from_session_id(session_id)
+    if user:
+        return jsonify({"email": user.email})
+    return abort(403)
+
+
+@route("/reset_password", "POST")
+async def get_reset_password_token(request: Request) -> Response:
+    email = request.form.get("email")
+    try:
+        token = await AUTH.get_reset_password_token(email)
+        return jsonify({"email": email, "reset_token": token})
+    except Exception:
+        return abort(403)
+
+
+@route("/reset_password", "PUT")
+async def update_password(request: Request) -> Response:
+    email = request.form.get("email")
+    reset_token = request.form.get("reset_token")
+    new_password = request.form.get("new_password")
+    try:
+        await AUTH.update_password(reset_token, new_password)
+        return jsonify({"email": email, "message": "Password updated"})
+    except Overloaded:
+        raise
+    except Exception:
+        return abort(403)
+
+
+@route("/metrics/bcrypt", "GET")
+async def bcrypt_metrics(request: Request) -> Response:
+    if not metrics_allowed(request):
+        return abort(403)
+    return jsonify(AUTH.bcrypt_stats())
+
+
+async def read_body(receive, limit: int = None) -> bytes:
+    """Read the whole body of an HTTP request
+    Raises:
+        BodyTooLarge as soon as more than limit bytes are received
+    """
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise BodyTooLarge
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def lifespan(receive, send) -> None:
+    """Create the tables at startup, release resources at shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await AUTH.init()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await AUTH.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive, send) -> None:
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    try:
+        request = Request(scope, await read_body(receive,
+                                                 MAX_CONTENT_LENGTH))
+    except BodyTooLarge:
+        await send_response(send, *abort(413))
+        return
+    path = request.path.rstrip("/") or "/"
+    handler = ROUTES.get((request.method, path))
+    if handler is not None:
+        try:
+            status, payload, headers = await handler(request)
+        except Overloaded:
+            status, payload, headers = jsonify(
+                {"message": "too many pending logins"}, 503)
+    elif any(route_path == path for _, route_path in ROUTES):
+        status, payload, headers = abort(405)
+    else:
+        status, payload, headers = abort(404)
+    await send_response(send, status, payload, headers)
+
+
+async def send_response(send, status: int, payload: dict,
+                        headers: List[Tuple[bytes, bytes]]) -> None:
+    """Send a JSON response"""
+    body = json.dumps(payload).encode("utf-8") if payload else b""
+    headers = headers + [(b"content-type", b"application/json"),
+                         (b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": status,
+                "headers": headers})
+    await send({"type": "http.response.body", "body": body})
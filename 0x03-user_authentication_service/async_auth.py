@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""asyncio counterpart of the Auth class
+"""
+from async_db import AsyncDB
+from auth import (TypeUser, _check_password, _check_policy,
+                  _generate_uuid, _hash_password)
+from bcrypt_executor import BcryptExecutor, Overloaded
+from password_policy import POLICY
+from session_store import session_store_from_env
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import NoResultFound
+from user import User
+
+
+class AsyncAuth:
+    """Auth class to interact with the authentication database from
+    coroutines: database calls are awaited and bcrypt runs in the
+    executor without blocking the event loop.
+    """
+
+    def __init__(self):
+        self._db = AsyncDB()
+        self._bcrypt = BcryptExecutor.from_env()
+        self._sessions = session_store_from_env()
+        _check_policy()
+        # benchmark the host now rather than on the first request
+        POLICY.rounds()
+
+    async def init(self) -> None:
+        """Create the database tables"""
+        await self._db.init()
+
+    async def close(self) -> None:
+        """Close the database and the bcrypt executor"""
+        await self._db.close()
+        self._bcrypt.shutdown()
+
+    async def _hash(self, password: str) -> bytes:
+        """Hash a password in the bcrypt executor with the policy's cost"""
+        return await self._bcrypt.run_async(_hash_password, password,
+                                            POLICY.rounds())
+
+    def bcrypt_stats(self) -> dict:
+        """Queue depth and latency metrics of the bcrypt executor"""
+        return self._bcrypt.stats()
+
+    async def register_user(self, email: str, password: str) -> User:
+        """Hash the password and save the user to the database
+        Return:
+            ValueError if user already exist base on email.
+            Return user object on success.
+        """
+        try:
+            return await self._db.add_user(email, await self._hash(password))
+        except IntegrityError:
+            raise ValueError(f"User {email} already exists")
+
+    async def valid_login(self, email: str, password: str) -> bool:
+        """Locate user by email and check the password, rehashing it if
+        it was hashed with a lower cost than the policy's
+        Return:
+            True, if it matches
+            False, if other cases
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+            if not await self._bcrypt.run_async(_check_password, password,
+                                                user.hashed_password):
+                return False
+        except Overloaded:
+            raise
+        except Exception:
+            return False
+        if POLICY.needs_rehash(user.hashed_password):
+            try:
+                await self._db.update_user(
+                    user.id, hashed_password=await self._hash(password))
+            except Overloaded:
+                # the login succeeded, rehash on a later one
+                pass
+        return True
+
+    async def create_session(self, email: str) -> str:
+        """Takes email string argument
+        Return:
+            Session id on success.
+            None on failure.
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+        except NoResultFound:
+            return
+        sess_id = _generate_uuid()
+        if user.session_id is not None:
+            self._sessions.delete(user.session_id)
+        await self._db.update_user(user.id, session_id=sess_id)
+        self._sessions.set(sess_id, user)
+        return sess_id
+
+    async def get_user_from_session_id(self, session_id: str) -> TypeUser:
+        """Takes a single session_id, looked up in the session store
+        before the database; with SESSION_VERIFY=1, a cached user is only
+        returned while the database still holds its session id
+        Return:
+            User on success
+            None on failure
+        """
+        if session_id is None:
+            return None
+        user = self._sessions.get(session_id)
+        if user is not None:
+            if not self._sessions.verify:
+                return user
+            # the session may have been ended by another process
+            if await self._db.session_id_of(user.id) == session_id:
+                return user
+            self._sessions.delete(session_id)
+            return None
+        try:
+            user = await self._db.find_user_by(session_id=session_id)
+        except Exception:
+            return None
+        self._sessions.set(session_id, user)
+        return user
+
+    async def destroy_session(self, user_id: int) -> None:
+        """Takes user_id argument and update the corresponding user's
+        session_id to None
+        """
+        try:
+            user = await self._db.find_user_by(id=user_id)
+            if user.session_id is not None:
+                self._sessions.delete(user.session_id)
+                await self._db.update_user(user.id, session_id=None)
+        except Exception:
+            return None
+        return None
+
+    async def get_reset_password_token(self, email: str) -> str:
+        """Takes an email string as arguments and set user reset_token
+        Return:
+            - Generated token on success.
+            - ValueError on Failure.
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+        except Exception:
+            raise ValueError
+        token = _generate_uuid()
+        await self._db.update_user(user.id, reset_token=token)
+        return token
+
+    async def update_password(self, reset_token: str, password: str) -> None:
+        """Uses reset token to validate update of users password"""
+        if reset_token is None or password is None:
+            return None
+
+        try:
+            user = await self._db.find_user_by(reset_token=reset_token)
+        except NoResultFound:
+            raise ValueError
+
+        hashed_password = await self._hash(password)
+        await self._db.update_user(user.id,
+                                   hashed_password=hashed_password,
+                                   reset_token=None)
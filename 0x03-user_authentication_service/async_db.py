@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Async DB module
+"""
+import os
+from typing import Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
+
+from db import _create_indexes, _set_sqlite_pragmas
+from user import Base, User
+
+
+class AsyncDB:
+    """
+    asyncio counterpart of DB, every call uses its own session
+    """
+
+    def __init__(self, url: str = None, production: bool = None) -> None:
+        """
+        Initialize a new AsyncDB instance, init() must be awaited before use
+
+        url defaults to AUTH_DB_ASYNC_URL, or AUTH_DB_URL with the
+        aiosqlite driver.
+        """
+        if url is None:
+            url = os.getenv("AUTH_DB_ASYNC_URL") or os.getenv(
+                "AUTH_DB_URL", "sqlite:///a.db").replace(
+                    "sqlite://", "sqlite+aiosqlite://", 1)
+        if production is None:
+            production = os.getenv("AUTH_DB_MODE") == "production"
+        self._production = production
+        self._engine = create_async_engine(url, echo=False)
+        if url.startswith("sqlite"):
+            event.listen(self._engine.sync_engine, "connect",
+                         _set_sqlite_pragmas)
+        self._sessionmaker = sessionmaker(self._engine, class_=AsyncSession,
+                                          expire_on_commit=False)
+
+    async def init(self) -> None:
+        """
+        Create the tables, dropping them first unless in production mode,
+        where the missing indexes of existing tables are created
+        Raises:
+            RuntimeError if emails are registered more than once
+        """
+        async with self._engine.begin() as conn:
+            if not self._production:
+                await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            if self._production:
+                await conn.run_sync(_create_indexes)
+
+    async def close(self) -> None:
+        """
+        Close the connections of the engine
+        """
+        await self._engine.dispose()
+
+    async def add_user(self, email: str, hashed_password: str) -> User:
+        """
+        add user
+        Raises:
+            IntegrityError if the email is already registered
+        """
+        if not email or not hashed_password:
+            return
+
+        new_user = User(email=email, hashed_password=hashed_password)
+        async with self._sessionmaker() as session:
+            session.add(new_user)
+            await session.commit()
+        return new_user
+
+    async def find_user_by(self, **kwargs) -> User:
+        """ find user function """
+        for key in kwargs:
+            if not hasattr(User, key):
+                raise InvalidRequestError
+        async with self._sessionmaker() as session:
+            result = await session.execute(select(User).filter_by(**kwargs))
+            try:
+                return result.scalars().one()
+            except NoResultFound:
+                raise NoResultFound
+
+    async def session_id_of(self, user_id: int) -> Optional[str]:
+        """Return the session id of a user, None if absent or logged out
+        """
+        async with self._sessionmaker() as session:
+            result = await session.execute(
+                select(User.session_id).filter_by(id=user_id))
+            return result.scalar()
+
+    async def update_user(self, user_id: int, **kwargs) -> None:
+        """update user attributes as passed in the method’s arguments
+        then commit changes to the database.
+        """
+        async with self._sessionmaker() as session:
+            user = await session.get(User, user_id)
+            if user is None:
+                raise ValueError
+            for key, value in kwargs.items():
+                if hasattr(user, key):
+                    setattr(user, key, value)
+                else:
+                    raise ValueError
+            await session.commit()
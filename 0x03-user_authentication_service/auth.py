@@ -1,22 +1,45 @@
 #!/usr/bin/env python3
 import bcrypt
+import os
+from bcrypt_executor import BcryptExecutor, Overloaded
+from bulk import export_users, import_users
+from password_policy import POLICY
+from session_store import session_store_from_env
 from user import User
 from uuid import uuid4
 from db import DB
-from typing import TypeVar, Union
+from metrics import METRICS
+from typing import Dict, Iterable, Iterator, TypeVar, Union
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 
 T = TypeVar("T", bound="User")
 TypeUser = Union[T, None]
 
 
-def _hash_password(password: str) -> bytes:
+def _hash_password(password: str, rounds: int = 12) -> bytes:
     """returns a bytes that is a salted hash of the input password"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds)
     return bcrypt.hashpw(password.encode("utf-8"), salt)
 
 
+def _check_password(password: str, hashed_password: bytes) -> bool:
+    """returns True if password matches the salted hash"""
+    return bcrypt.checkpw(password.encode("utf-8"), hashed_password)
+
+
+def _check_policy() -> None:
+    """In production mode, the bcrypt cost must not depend on a benchmark
+    made by each process at startup
+    Raises:
+        RuntimeError if neither BCRYPT_ROUNDS nor BCRYPT_ROUNDS_FILE is set
+    """
+    if os.getenv("AUTH_DB_MODE") == "production" and not POLICY.fixed \
+            and POLICY.rounds_file is None:
+        raise RuntimeError("set BCRYPT_ROUNDS or BCRYPT_ROUNDS_FILE "
+                           "in production mode")
+
+
 def _generate_uuid() -> str:
     """return a string representation of a UUID"""
     return str(uuid4())
@@ -28,33 +51,78 @@ class Auth:
 
     def __init__(self):
         self._db = DB()
+        self._bcrypt = BcryptExecutor.from_env()
+        self._sessions = session_store_from_env()
+        _check_policy()
+        # benchmark the host now rather than on the first request
+        POLICY.rounds()
+
+    @METRICS.timed("auth_phase_seconds", phase="password_hash")
+    def _hash(self, password: str) -> bytes:
+        """Hash a password in the bcrypt executor with the policy's cost"""
+        return self._bcrypt.run(_hash_password, password, POLICY.rounds())
+
+    def end_request(self) -> None:
+        """Release the database session of the current thread"""
+        self._db.remove_session()
+
+    def bcrypt_stats(self) -> dict:
+        """Queue depth and latency metrics of the bcrypt executor"""
+        return self._bcrypt.stats()
+
+    def import_users(self, records: Iterable[dict],
+                     batch_size: int = 1000) -> Dict[str, int]:
+        """Insert users in batches, hashing passwords in the bcrypt
+        executor with one call per worker at a time
+        Return:
+            counts of read, inserted, skipped and invalid records
+        """
+        return import_users(self._db, records, self._bcrypt,
+                            _hash_password, batch_size)
+
+    def export_users(self) -> Iterator[str]:
+        """Yield every user as an NDJSON line"""
+        return export_users(self._db)
 
     def register_user(self, email: str, password: str) -> User:
         """Hash the password using _hash_password,and save
-        the user to the database
+        the user to the database. Duplicates are rejected by the unique
+        constraint on email, without a prior lookup.
         Return:
             ValueError if user already exist base on email.
             Return user object on success.
         """
         try:
-            self._db.find_user_by(email=email)
+            return self._db.add_user(email, self._hash(password))
+        except IntegrityError:
             raise ValueError(f"User {email} already exists")
-        except NoResultFound:
-            return self._db.add_user(email, _hash_password(password))
 
     def valid_login(self, email: str, password: str) -> bool:
-        """Locate user by email, check the password with bcrypt.checkpw
+        """Locate user by email, check the password with bcrypt.checkpw.
+        Hashes made with a lower cost than the policy's are replaced.
         Return:
             True, if it matches
             False, if other cases
         """
         try:
-            user = self._db.find_user_by(email=email)
-            if bcrypt.checkpw(password.encode("utf-8"), user.hashed_password):
-                return True
-            return False
+            with METRICS.time("auth_phase_seconds", phase="user_lookup"):
+                user = self._db.find_user_by(email=email)
+            with METRICS.time("auth_phase_seconds", phase="password_verify"):
+                if not self._bcrypt.run(_check_password, password,
+                                        user.hashed_password):
+                    return False
+        except Overloaded:
+            raise
         except Exception:
             return False
+        if POLICY.needs_rehash(user.hashed_password):
+            try:
+                self._db.update_user(user.id,
+                                     hashed_password=self._hash(password))
+            except Overloaded:
+                # the login succeeded, rehash on a later one
+                pass
+        return True
 
     def create_session(self, email: str) -> str:
         """Takes email string argument
@@ -65,24 +133,40 @@ class Auth:
         try:
             user = self._db.find_user_by(email=email)
             sess_id = _generate_uuid()
+            if user.session_id is not None:
+                self._sessions.delete(user.session_id)
             self._db.update_user(user.id, session_id=sess_id)
+            self._sessions.set(sess_id, user)
             return sess_id
         except NoResultFound:
             return
 
+    @METRICS.timed("auth_phase_seconds", phase="session_lookup")
     def get_user_from_session_id(self, session_id: str) -> TypeUser:
-        """Takes a single session_id
+        """Takes a single session_id, looked up in the session store
+        before the database; with SESSION_VERIFY=1, a cached user is only
+        returned while the database still holds its session id
         Return:
             User on success
             None on failure
         """
         if session_id is None:
             return None
+        user = self._sessions.get(session_id)
+        if user is not None:
+            if not self._sessions.verify:
+                return user
+            # the session may have been ended by another process
+            if self._db.session_id_of(user.id) == session_id:
+                return user
+            self._sessions.delete(session_id)
+            return None
         try:
             user = self._db.find_user_by(session_id=session_id)
-            return user
         except Exception:
             return None
+        self._sessions.set(session_id, user)
+        return user
 
     def destroy_session(self, user_id: int) -> None:
         """Takes user_id argument and updat the corresponding user's
@@ -93,6 +177,7 @@ class Auth:
         try:
             user = self._db.find_user_by(id=user_id)
             if user.session_id is not None:
+                self._sessions.delete(user.session_id)
                 self._db.update_user(user.id, session_id=None)
         except Exception:
             return None
@@ -124,7 +209,7 @@ class Auth:
         except NoResultFound:
             raise ValueError
 
-        hashed_password = _hash_password(password)
+        hashed_password = self._hash(password)
         try:
             self._db.update_user(user.id,
                                  hashed_password=hashed_password,
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Executor running bcrypt off the request threads
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator
+import asyncio
+import os
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when too many bcrypt calls are already pending
+    """
+
+
+class BcryptExecutor:
+    """Runs bcrypt calls in a pool of workers with a bounded queue.
+
+    kind is "process" (default), "thread" or "inline" (no pool). When
+    max_pending calls are already queued or running, run() raises
+    Overloaded instead of queueing more work.
+    """
+
+    def __init__(self, kind: str = "process", workers: int = None,
+                 max_pending: int = None) -> None:
+        """Initialize the executor, the pool is started on first use
+        """
+        if kind not in ("process", "thread", "inline"):
+            raise ValueError(f"unknown bcrypt executor: {kind}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @classmethod
+    def from_env(cls) -> "BcryptExecutor":
+        """Build an executor configured by BCRYPT_EXECUTOR, BCRYPT_WORKERS
+        and BCRYPT_MAX_PENDING
+        """
+        return cls(os.getenv("BCRYPT_EXECUTOR", "process"),
+                   int(os.getenv("BCRYPT_WORKERS", 0)),
+                   int(os.getenv("BCRYPT_MAX_PENDING", 0)))
+
+    @property
+    def pool(self):
+        """Lazily started pool of workers
+        """
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    self._pool = ProcessPoolExecutor(self.workers)
+                else:
+                    self._pool = ThreadPoolExecutor(self.workers)
+            return self._pool
+
+    def _acquire(self, blocking: bool = False) -> float:
+        """Reserve a slot for a call and return its start time, waiting
+        for one if blocking
+        Raises:
+            Overloaded if max_pending calls are already pending
+        """
+        if not self._slots.acquire(blocking=blocking):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded
+        with self._lock:
+            self.pending += 1
+        return time.perf_counter()
+
+    def _release(self, start: float) -> None:
+        """Release the slot of a call started at start"""
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        self._slots.release()
+
+    def run(self, fn: Callable, *args):
+        """Run fn(*args) in the pool and wait for its result
+        Raises:
+            Overloaded if max_pending calls are already pending
+        """
+        start = self._acquire()
+        try:
+            if self.kind == "inline":
+                return fn(*args)
+            return self.pool.submit(fn, *args).result()
+        finally:
+            self._release(start)
+
+    async def run_async(self, fn: Callable, *args):
+        """Run fn(*args) in the pool without blocking the event loop
+        Raises:
+            Overloaded if max_pending calls are already pending
+        """
+        start = self._acquire()
+        try:
+            if self.kind == "inline":
+                return fn(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            self._release(start)
+
+    def map(self, fn: Callable, *iterables: Iterable,
+            concurrency: int = None) -> Iterator:
+        """Yield fn(*args) for the args of iterables, in order, with at
+        most concurrency calls (default: the number of workers) pending.
+        Slots are waited for rather than Overloaded raised, so bulk work
+        is throttled while leaving the other slots to single calls.
+        """
+        concurrency = min(concurrency or self.workers, self.max_pending)
+        calls = deque()
+        try:
+            for args in zip(*iterables):
+                if len(calls) >= concurrency:
+                    yield self._collect(*calls.popleft())
+                start = self._acquire(blocking=True)
+                if self.kind == "inline":
+                    try:
+                        result = fn(*args)
+                    finally:
+                        self._release(start)
+                    yield result
+                    continue
+                try:
+                    calls.append((self.pool.submit(fn, *args), start))
+                except BaseException:
+                    self._release(start)
+                    raise
+            while calls:
+                yield self._collect(*calls.popleft())
+        finally:
+            # abandoned calls keep their slot until they are done
+            for future, start in calls:
+                future.cancel()
+                future.add_done_callback(
+                    lambda _, start=start: self._release(start))
+
+    def _collect(self, future, start: float):
+        """Result of a call submitted by map(), releasing its slot"""
+        try:
+            return future.result()
+        finally:
+            self._release(start)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and latency metrics of the executor
+        """
+        with self._lock:
+            average = self.total_latency / self.completed \
+                if self.completed else 0.0
+            return {"kind": self.kind, "workers": self.workers,
+                    "pending": self.pending,
+                    "max_pending": self.max_pending,
+                    "completed": self.completed, "rejected": self.rejected,
+                    "avg_latency_ms": average * 1000,
+                    "max_latency_ms": self.max_latency * 1000}
+
+    def shutdown(self) -> None:
+        """Stop the pool of workers
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
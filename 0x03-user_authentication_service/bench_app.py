@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Benchmark of the service flows, run in-process or against a server
+
+Usage:
+    $ ./bench_app.py [-c CONCURRENCY] [-u USERS] [-p PROFILES] \\
+        [--url URL] [-o results.json] [--baseline old.json]
+
+Each virtual user registers, fails a login, logs in, reads its profile
+PROFILES times, resets its password, logs in with the new one and logs
+out. Without --url the app is driven through Flask's test client with a
+fresh database in a temporary directory. Results are saved as JSON and
+compared with a baseline: the script exits with 1 when the p95 latency
+of an endpoint regressed by more than --threshold percent.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from urllib.parse import urlencode, urlsplit
+import argparse
+import http.client
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+
+from bench_loadtest import FORM, print_summary, summarize
+
+
+class TestClient:
+    """Requests sent to the app through Flask's test client"""
+
+    def __init__(self, app) -> None:
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str,
+                data: dict = None) -> (int, dict):
+        """Send a request, return its status and JSON payload"""
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self) -> None:
+        """Nothing to release"""
+
+
+class HTTPClient:
+    """Requests sent to a running server over a keep-alive connection,
+    cookies are kept like a browser would"""
+
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname,
+                                               parts.port or 80)
+        self.cookies = {}
+
+    def request(self, method: str, path: str,
+                data: dict = None) -> (int, dict):
+        """Send a request, return its status and JSON payload"""
+        headers = dict(FORM) if data is not None else {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(
+                f"{key}={value}" for key, value in self.cookies.items())
+        body = urlencode(data) if data is not None else None
+        self.conn.request(method, path, body, headers)
+        response = self.conn.getresponse()
+        payload = response.read()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            key, _, value = header.split(";")[0].partition("=")
+            self.cookies[key.strip()] = value
+        try:
+            return response.status, json.loads(payload)
+        except ValueError:
+            return response.status, None
+
+    def close(self) -> None:
+        """Close the connection"""
+        self.conn.close()
+
+
+def virtual_user(client, profiles: int) -> Dict[str, List[float]]:
+    """Run the flow of one user, return the latencies per endpoint"""
+    latencies = {}
+    email = f"{uuid.uuid4()}@example.com"
+    password, new_password = "b4l0u", "t4rt1fl3tt3"
+
+    def request(name: str, method: str, path: str, expected: int,
+                data: dict = None) -> dict:
+        start = time.perf_counter()
+        status, payload = client.request(method, path, data)
+        latencies.setdefault(name, []).append(time.perf_counter() - start)
+        if status != expected:
+            raise AssertionError(f"{name}: {status}, expected {expected}")
+        return payload
+
+    credentials = {"email": email, "password": password}
+    request("register", "POST", "/users", 200, credentials)
+    request("login (wrong password)", "POST", "/sessions", 401,
+            {"email": email, "password": new_password})
+    request("login", "POST", "/sessions", 200, credentials)
+    for _ in range(profiles):
+        request("profile", "GET", "/profile", 200)
+    token = request("reset token", "POST", "/reset_password", 200,
+                    {"email": email})["reset_token"]
+    request("update password", "PUT", "/reset_password", 200,
+            {"email": email, "reset_token": token,
+             "new_password": new_password})
+    request("login", "POST", "/sessions", 200,
+            {"email": email, "password": new_password})
+    request("logout", "DELETE", "/sessions", 302)
+    client.close()
+    return latencies
+
+
+def run(client_factory, concurrency: int, users: int,
+        profiles: int) -> Dict[str, dict]:
+    """Run users virtual users, concurrency at a time"""
+    latencies = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = [executor.submit(virtual_user, client_factory(), profiles)
+                   for _ in range(users)]
+        for future in futures:
+            for endpoint, values in future.result().items():
+                latencies.setdefault(endpoint, []).extend(values)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def compare(baseline: Dict[str, dict], results: Dict[str, dict],
+            threshold: float) -> List[str]:
+    """Endpoints whose p95 latency grew by more than threshold percent"""
+    regressions = []
+    for endpoint, stats in results.items():
+        before = baseline.get(endpoint)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (stats["p95_ms"] / before["p95_ms"] - 1) * 100
+        print("  {:<22} p95 {:>9.2f} -> {:>9.2f} ms ({:+.1f}%)".format(
+            endpoint, before["p95_ms"], stats["p95_ms"], change))
+        if change > threshold:
+            regressions.append(endpoint)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-u", "--users", type=int, default=200)
+    parser.add_argument("-p", "--profiles", type=int, default=10)
+    parser.add_argument("--url", help="server to run against "
+                        "(default: the app in-process)")
+    parser.add_argument("-o", "--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="allowed p95 regression in percent")
+    args = parser.parse_args()
+
+    if args.url:
+        def client_factory():
+            return HTTPClient(args.url)
+        target = args.url
+    else:
+        # a cheap cost and a throwaway database, unless set by the caller
+        os.environ.setdefault("BCRYPT_ROUNDS", "4")
+        os.environ.setdefault("AUTH_DB_URL", "sqlite:///{}".format(
+            os.path.join(tempfile.mkdtemp(), "bench.db")))
+        from app import app
+
+        def client_factory():
+            return TestClient(app)
+        target = "in-process"
+
+    summary = run(client_factory, args.concurrency, args.users,
+                  args.profiles)
+    print_summary(f"{target} (concurrency {args.concurrency}, "
+                  f"{args.users} users)", summary)
+    results = {
+        "meta": {"target": target, "concurrency": args.concurrency,
+                 "users": args.users, "profiles": args.profiles,
+                 "bcrypt_rounds": os.getenv("BCRYPT_ROUNDS"),
+                 "python": platform.python_version(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "endpoints": summary}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["endpoints"]
+        print(f"compared with {args.baseline}")
+        regressions = compare(baseline, summary, args.threshold)
+        if regressions:
+            print("regressions: " + ", ".join(regressions))
+            sys.exit(1)
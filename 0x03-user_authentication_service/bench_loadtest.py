@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""HTTP load test comparing running instances of the service
+
+Usage:
+    $ ./bench_loadtest.py [-c CONCURRENCY] [-u USERS] [-p PROFILES] \\
+        flask=http://localhost:5000 asgi=http://localhost:5001
+
+Each virtual user registers, logs in, reads its profile PROFILES times
+and logs out, over a keep-alive connection. Every target must be started
+beforehand, e.g. with a cheap bcrypt cost:
+    $ BCRYPT_ROUNDS=4 gunicorn -w 1 --threads 64 -b :5000 app:app
+    $ BCRYPT_ROUNDS=4 uvicorn async_app:app --port 5001
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from urllib.parse import urlencode, urlsplit
+import argparse
+import http.client
+import time
+import uuid
+
+
+FORM = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """q-th percentile (0-100) of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def summarize(latencies: Dict[str, List[float]],
+              elapsed: float) -> Dict[str, dict]:
+    """Latency percentiles (ms) and throughput (req/s) per endpoint"""
+    summary = {}
+    for endpoint, values in sorted(latencies.items()):
+        values = sorted(values)
+        summary[endpoint] = {
+            "requests": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "throughput": len(values) / elapsed if elapsed else 0.0}
+    return summary
+
+
+def print_summary(name: str, summary: Dict[str, dict]) -> None:
+    """Print the summary of a run as a table"""
+    print(name)
+    print("  {:<22} {:>8} {:>9} {:>9} {:>9} {:>10}".format(
+        "endpoint", "requests", "p50 (ms)", "p95 (ms)", "p99 (ms)",
+        "req/s"))
+    for endpoint, stats in summary.items():
+        print("  {:<22} {:>8} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.1f}".format(
+            endpoint, stats["requests"], stats["p50_ms"], stats["p95_ms"],
+            stats["p99_ms"], stats["throughput"]))
+
+
+def virtual_user(url: str, profiles: int) -> Dict[str, List[float]]:
+    """Run the flow of one user, return the latencies per endpoint"""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    latencies = {}
+    email = f"{uuid.uuid4()}@example.com"
+    credentials = urlencode({"email": email, "password": "pwd"})
+
+    def request(method: str, path: str, body: str = None,
+                headers: dict = None) -> http.client.HTTPResponse:
+        start = time.perf_counter()
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        response.read()
+        latencies.setdefault(f"{method} {path}", []).append(
+            time.perf_counter() - start)
+        return response
+
+    request("POST", "/users", credentials, FORM)
+    response = request("POST", "/sessions", credentials, FORM)
+    cookie = response.getheader("Set-Cookie", "").split(";")[0]
+    for _ in range(profiles):
+        request("GET", "/profile", headers={"Cookie": cookie})
+    request("DELETE", "/sessions", headers={"Cookie": cookie})
+    conn.close()
+    return latencies
+
+
+def run(url: str, concurrency: int, users: int,
+        profiles: int) -> Dict[str, dict]:
+    """Run users virtual users, concurrency at a time, against url"""
+    latencies = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for result in executor.map(virtual_user, [url] * users,
+                                   [profiles] * users):
+            for endpoint, values in result.items():
+                latencies.setdefault(endpoint, []).extend(values)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="+", metavar="NAME=URL")
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("-u", "--users", type=int, default=500)
+    parser.add_argument("-p", "--profiles", type=int, default=10)
+    args = parser.parse_args()
+    for target in args.targets:
+        name, url = target.split("=", 1)
+        print_summary(f"{name} ({url})", run(url, args.concurrency,
+                                             args.users, args.profiles))
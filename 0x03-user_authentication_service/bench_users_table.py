@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Benchmark of the login and profile lookups on a large users table
+
+Usage:
+    $ ./bench_users_table.py [users] [lookups]
+
+Times find_user_by(email=...) (login) and find_user_by(session_id=...)
+(profile) with the indexes of user.py, then with the indexes dropped.
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from user import Base, User
+
+DB_PATH = "bench_users.db"
+
+
+def create_users(engine, users: int) -> None:
+    """Insert users fake users, one in ten with a session"""
+    Base.metadata.create_all(engine)
+    batch = 50000
+    with engine.begin() as conn:
+        for start in range(0, users, batch):
+            conn.execute(User.__table__.insert(), [
+                {"email": f"user{i}@example.com",
+                 "hashed_password": "$2b$12$" + "x" * 53,
+                 "session_id": f"session-{i}" if i % 10 == 0 else None}
+                for i in range(start, min(start + batch, users))])
+
+
+def timed(session, lookups: int, users: int, **kwargs) -> float:
+    """Average latency of find_user_by in microseconds, kwargs maps the
+    column to a format taking the user number
+    """
+    (column, fmt), = kwargs.items()
+    step = max(users // lookups, 10)
+    values = [fmt.format(i) for i in range(0, users, step)][:lookups]
+    start = time.perf_counter()
+    for value in values:
+        session.query(User).filter_by(**{column: value}).one()
+    return (time.perf_counter() - start) / len(values) * 1e6
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    engine = create_engine(f"sqlite:///{DB_PATH}")
+    create_users(engine, users)
+    session = sessionmaker(bind=engine)()
+
+    print(f"{users} users, {lookups} lookups")
+    print("{:>10} {:>14} {:>16}".format("lookup", "indexed (us)",
+                                        "unindexed (us)"))
+    results = {}
+    for name, kwargs in (("login", {"email": "user{}@example.com"}),
+                         ("profile", {"session_id": "session-{}"})):
+        results[name] = [timed(session, lookups, users, **kwargs)]
+    with engine.begin() as conn:
+        for index in ("ix_users_email", "ix_users_session_id"):
+            conn.execute(text(f"DROP INDEX {index}"))
+    for name, kwargs in (("login", {"email": "user{}@example.com"}),
+                         ("profile", {"session_id": "session-{}"})):
+        # full scans: a few lookups are enough
+        results[name].append(timed(session, 10, users, **kwargs))
+        print("{:>10} {:>14.1f} {:>16.1f}".format(name, *results[name]))
+    session.close()
+    os.remove(DB_PATH)
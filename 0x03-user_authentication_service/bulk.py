@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Bulk import and export of users
+
+Usage:
+    $ ./bulk.py import users.ndjson [--format csv] [--batch-size N]
+    $ ./bulk.py export [users.ndjson]
+
+Records are NDJSON objects or CSV rows with an email and either a
+password, hashed in parallel, or an already computed bcrypt
+hashed_password.
+"""
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, TextIO
+import argparse
+import csv
+import json
+import os
+import sys
+
+from bcrypt_executor import BcryptExecutor
+from db import DB
+from password_policy import POLICY
+
+
+def read_records(stream: TextIO, fmt: str = "ndjson") -> Iterator[dict]:
+    """Yield the records of an NDJSON or CSV stream, None for a line
+    that is not valid JSON"""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def _user(record) -> dict:
+    """User to insert from a record: a dict of a str email and either a
+    str bcrypt hashed_password or a str password, None if invalid"""
+    if not isinstance(record, dict):
+        return None
+    email = record.get("email")
+    hashed_password = record.get("hashed_password")
+    password = record.get("password")
+    if not email or not isinstance(email, str):
+        return None
+    if hashed_password:
+        if not isinstance(hashed_password, str) or \
+                not hashed_password.startswith("$2"):
+            return None
+        return {"email": email, "hashed_password": hashed_password.encode()}
+    if password and isinstance(password, str):
+        return {"email": email, "password": password}
+    return None
+
+
+def import_users(db: DB, records: Iterable[dict], executor: BcryptExecutor,
+                 hash_password: Callable[[str, int], bytes],
+                 batch_size: int = 1000) -> Dict[str, int]:
+    """Insert users batch_size at a time, one transaction per batch.
+
+    Passwords are hashed in parallel by hash_password(password, rounds)
+    in executor with the policy's cost, at most one call per worker at
+    a time; records with a hashed_password are inserted as is.
+    Records that are not objects, or miss or mistype a field, are
+    counted as invalid. If the stream itself can't be read (bad
+    encoding or CSV), the import stops there: the batches already
+    inserted are kept and the counts get an "error".
+    Return:
+        counts of read, inserted, skipped (already registered) and
+        invalid records
+    """
+    counts = {"read": 0, "inserted": 0, "skipped": 0, "invalid": 0}
+    rounds = POLICY.rounds()
+    records = iter(records)
+    while "error" not in counts:
+        batch = []
+        try:
+            batch.extend(islice(records, batch_size))
+        except (ValueError, csv.Error) as e:
+            counts["error"] = str(e)
+        if not batch:
+            return counts
+        counts["read"] += len(batch)
+        users, passwords = [], []
+        for record in batch:
+            user = _user(record)
+            if user is None:
+                counts["invalid"] += 1
+            elif "password" in user:
+                passwords.append(user.pop("password"))
+                users.append(user)
+            else:
+                users.append(user)
+        hashes = executor.map(hash_password, passwords,
+                              [rounds] * len(passwords))
+        for user, hashed_password in zip(
+                (user for user in users if "hashed_password" not in user),
+                hashes):
+            user["hashed_password"] = hashed_password
+        inserted = db.add_users(users)
+        counts["inserted"] += inserted
+        counts["skipped"] += len(users) - inserted
+    return counts
+
+
+def export_users(db: DB, batch_size: int = 1000) -> Iterator[str]:
+    """Yield every user as an NDJSON line"""
+    for user in db.iter_users(batch_size):
+        hashed_password = user.hashed_password
+        if isinstance(hashed_password, bytes):
+            hashed_password = hashed_password.decode()
+        yield json.dumps({"id": user.id, "email": user.email,
+                          "hashed_password": hashed_password}) + "\n"
+
+
+if __name__ == "__main__":
+    from auth import _hash_password
+
+    parser = argparse.ArgumentParser(description="Bulk import/export users")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("file", nargs="?",
+                        help="input or output file (default: stdin/stdout)")
+    parser.add_argument("--format", choices=("ndjson", "csv"),
+                        default="ndjson", help="format of the import")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    # keep the existing users whatever AUTH_DB_MODE is
+    db = DB(production=True)
+    if args.command == "import":
+        stream = open(args.file, newline="") if args.file else sys.stdin
+        executor = BcryptExecutor("process", args.workers)
+        try:
+            with stream:
+                counts = import_users(db, read_records(stream, args.format),
+                                      executor, _hash_password,
+                                      args.batch_size)
+        finally:
+            executor.shutdown()
+        print(json.dumps(counts))
+    else:
+        stream = open(args.file, "w") if args.file else sys.stdout
+        with stream:
+            stream.writelines(export_users(db, args.batch_size))
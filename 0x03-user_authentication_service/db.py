@@ -1,42 +1,124 @@
 #!/usr/bin/env python3
 """DB module
 """
-from sqlalchemy import create_engine
+import os
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine, event, func, inspect, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 
+from metrics import METRICS
 from user import Base, User
 
 
+METRICS.describe("db_operation_seconds", "Latency of the database operations")
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Configure every new SQLite connection for concurrent access
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout={}".format(
+        int(float(os.getenv("AUTH_DB_BUSY_TIMEOUT", 5)) * 1000)))
+    cursor.close()
+
+
+def _create_indexes(connection) -> None:
+    """
+    Create the indexes of the users table that a table created by an
+    earlier schema lacks: create_all() skips existing tables
+    Raises:
+        RuntimeError if a unique index can't be created because of
+        duplicate values
+    """
+    existing = {index["name"] for index
+                in inspect(connection).get_indexes(User.__tablename__)}
+    for index in User.__table__.indexes:
+        if index.name in existing:
+            continue
+        if index.unique:
+            columns = list(index.columns)
+            duplicates = connection.execute(
+                select(*columns).group_by(*columns).having(
+                    func.count() > 1).limit(5)).all()
+            if duplicates:
+                raise RuntimeError(
+                    "cannot create the unique index {}, duplicate values: "
+                    "{}".format(index.name, ", ".join(
+                        str(tuple(row)) for row in duplicates)))
+        index.create(connection)
+
+
 class DB:
     """
     DB class
+
+    Each thread gets its own session from a scoped_session registry;
+    remove_session() must be called when a request ends.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, url: str = None, production: bool = None) -> None:
         """
         Initialize a new DB instance
+
+        url defaults to AUTH_DB_URL (sqlite:///a.db). Unless in production
+        mode (AUTH_DB_MODE=production), the tables are dropped first; in
+        production mode they are only created if missing, as are the
+        indexes of an existing table, and the engine pool is sized by
+        AUTH_DB_POOL_SIZE and AUTH_DB_MAX_OVERFLOW.
+        Raises:
+            RuntimeError if emails are registered more than once
         """
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
+        if url is None:
+            url = os.getenv("AUTH_DB_URL", "sqlite:///a.db")
+        if production is None:
+            production = os.getenv("AUTH_DB_MODE") == "production"
+        options = {}
+        sqlite = url.startswith("sqlite")
+        if sqlite:
+            options["connect_args"] = {
+                "check_same_thread": False,
+                "timeout": float(os.getenv("AUTH_DB_BUSY_TIMEOUT", 5))}
+        if production and not (sqlite and ":memory:" in url):
+            options["pool_size"] = int(os.getenv("AUTH_DB_POOL_SIZE", 10))
+            options["max_overflow"] = int(
+                os.getenv("AUTH_DB_MAX_OVERFLOW", 20))
+        self._engine = create_engine(url, echo=False, **options)
+        if sqlite:
+            event.listen(self._engine, "connect", _set_sqlite_pragmas)
+        if not production:
+            Base.metadata.drop_all(self._engine)
         Base.metadata.create_all(self._engine)
-        self.__session = None
+        if production:
+            with self._engine.begin() as connection:
+                _create_indexes(connection)
+        self.__session = scoped_session(
+            sessionmaker(bind=self._engine, expire_on_commit=False))
 
     @property
     def _session(self):
-        """Memoized session object
+        """Session of the current thread
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        return self.__session()
 
+    def remove_session(self) -> None:
+        """Close the session of the current thread
+        """
+        self.__session.remove()
+
+    @METRICS.timed("db_operation_seconds", operation="add_user")
     def add_user(self, email: str, hashed_password: str) -> User:
         """
         add user
+        Raises:
+            IntegrityError if the email is already registered
         """
         if not email or not hashed_password:
             return
@@ -44,9 +126,47 @@ class DB:
         new_user = User(email=email, hashed_password=hashed_password)
         session = self._session
         session.add(new_user)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            raise
         return new_user
 
+    @METRICS.timed("db_operation_seconds", operation="add_users")
+    def add_users(self, users: List[Dict[str, bytes]]) -> int:
+        """
+        Insert a batch of users (dicts of email and hashed_password) with
+        a single executemany in one transaction. Emails already
+        registered are skipped on SQLite and MySQL.
+        Return:
+            the number of inserted users
+        """
+        if not users:
+            return 0
+        statement = User.__table__.insert()
+        dialect = self._engine.dialect.name
+        if dialect == "sqlite":
+            statement = statement.prefix_with("OR IGNORE")
+        elif dialect == "mysql":
+            statement = statement.prefix_with("IGNORE")
+        session = self._session
+        try:
+            result = session.execute(statement, users)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result.rowcount
+
+    def iter_users(self, batch_size: int = 1000) -> Iterator[User]:
+        """
+        Yield every user ordered by id, batch_size rows at a time
+        """
+        query = self._session.query(User).order_by(User.id)
+        return query.yield_per(batch_size)
+
+    @METRICS.timed("db_operation_seconds", operation="find_user_by")
     def find_user_by(self, **kwargs) -> User:
         """ find user function """
         for key in kwargs:
@@ -59,6 +179,14 @@ class DB:
 
         return user
 
+    @METRICS.timed("db_operation_seconds", operation="session_id_of")
+    def session_id_of(self, user_id: int) -> Optional[str]:
+        """Return the session id of a user, None if absent or logged out
+        """
+        return self._session.query(User.session_id).filter_by(
+            id=user_id).scalar()
+
+    @METRICS.timed("db_operation_seconds", operation="update_user")
     def update_user(self, user_id: int, **kwargs) -> None:
         """update user attributes as passed in the method’s arguments
         then commit changes to the database.
@@ -73,4 +201,6 @@ class DB:
             if hasattr(user, key):
                 setattr(user, key, value)
             else:
+                self._session.rollback()
                 raise ValueError
+        self._session.commit()
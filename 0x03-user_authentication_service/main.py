@@ -34,14 +34,14 @@ def profile_unlogged() -> None:
 def profile_logged(session_id: str) -> None:
     """ profile logged"""
     x = requests.get('http://localhost:5000/profile',
-                     cookies={"session_id", session_id})
+                     cookies={"session_id": session_id})
     assert x.status_code == 200
 
 
 def log_out(session_id: str) -> None:
     """ log out"""
     x = requests.delete('http://localhost:5000/sessions',
-                        cookies={"session_id", session_id})
+                        cookies={"session_id": session_id})
     assert x.status_code == 200
 
 
@@ -49,6 +49,7 @@ def reset_password_token(email: str) -> str:
     """ reset password token """
     x = requests.post('http://localhost:5000/reset_password', {'email': email})
     assert x.status_code == 200
+    return x.json()['reset_token']
 
 
 def update_password(email: str, reset_token: str, new_password: str) -> None:
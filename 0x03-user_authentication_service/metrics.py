@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Latency histograms exposed in the Prometheus text format
+
+0x01-Basic_authentication (api/v1/metrics.py) and
+0x03-user_authentication_service (metrics.py) keep an identical copy of
+this module: the projects share no package. The metrics specific to an
+app are described where they are recorded.
+
+METRICS_ENABLED=0 turns the instrumentation off. METRICS_PROFILE_RATE
+(0 to 1, default 0) is the fraction of requests run under cProfile, their
+stats are dumped to METRICS_PROFILE_DIR, one .prof file per request.
+"""
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Tuple
+import cProfile
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts of observations per bucket, their sum and count"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Record one observation"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+def _key(name: str, labels: Dict[str, str]) -> tuple:
+    """Key of the histogram of name and labels"""
+    return name, tuple(sorted(labels.items()))
+
+
+class _Timer:
+    """Context manager observing its duration in a histogram"""
+
+    __slots__ = ("registry", "key", "start")
+
+    def __init__(self, registry: "Registry", key: tuple) -> None:
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.registry.observe_key(self.key,
+                                  time.perf_counter() - self.start)
+
+
+class Registry:
+    """Histograms by name and labels, and gauges read when rendered"""
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help: str) -> None:
+        """Set the help text of a metric"""
+        self.help[name] = help
+
+    def gauge(self, name: str, callback: Callable[[], float],
+              help: str = None) -> None:
+        """Expose the value returned by callback as a gauge"""
+        self.gauges[name] = callback
+        if help:
+            self.describe(name, help)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record value in the histogram of name and labels"""
+        self.observe_key(_key(name, labels), value)
+
+    def observe_key(self, key: tuple, value: float) -> None:
+        """Record value in the histogram of a key built by _key()"""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(value)
+
+    def time(self, name: str, **labels: str) -> _Timer:
+        """Context manager timing its block"""
+        return _Timer(self, _key(name, labels))
+
+    def timed(self, name: str, **labels: str) -> Callable:
+        """Decorator timing every call of a function"""
+        def decorator(func: Callable) -> Callable:
+            if not self.enabled:
+                return func
+            key = _key(name, labels)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe_key(key, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        described = set()
+        for (name, labels), histogram in histograms:
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            with histogram._lock:
+                counts = list(histogram.counts)
+                total, count = histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ("+Inf",),
+                                           counts):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(
+                    name, _format_labels(labels + (("le", str(bound)),)),
+                    cumulative))
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for name, callback in sorted(self.gauges.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {callback()}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """{key="value",...} with escaped values"""
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+            "\n", "\\n")) for key, value in labels) + "}"
+
+
+METRICS = Registry(os.getenv("METRICS_ENABLED", "1") != "0")
+METRICS.describe("http_request_duration_seconds",
+                 "Latency of the requests per route")
+METRICS.describe("auth_phase_seconds",
+                 "Latency of the authentication phases")
+
+
+class RequestProfiler:
+    """Runs a sample of the requests under cProfile, one at a time"""
+
+    def __init__(self, rate: float, directory: str) -> None:
+        self.rate = rate
+        self.directory = directory
+        self.profiled = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> cProfile.Profile:
+        """Start profiling the request if sampled and no other request
+        is being profiled
+        Return:
+            the profiler, or None
+        """
+        if self.rate <= 0 or random.random() >= self.rate:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active in this process
+            self._lock.release()
+            return None
+        return profiler
+
+    def stop(self, profiler: cProfile.Profile, name: str) -> str:
+        """Stop profiling and dump the stats
+        Return:
+            the path of the .prof file
+        """
+        profiler.disable()
+        self._lock.release()
+        filename = "{}-{}.prof".format(time.time_ns(),
+                                       re.sub(r"[^\w.-]+", "_", name))
+        path = os.path.join(self.directory, filename)
+        profiler.dump_stats(path)
+        self.profiled += 1
+        return path
+
+
+def instrument_app(app, path: str = "/metrics",
+                   registry: Registry = METRICS,
+                   guard: Callable[[], None] = None) -> None:
+    """Time every request of a Flask app per route, method and status,
+    profile a sample of them and serve the metrics on path, after
+    calling guard (which aborts unauthorized requests) if given"""
+    from flask import Response, g, request
+
+    directory = os.getenv("METRICS_PROFILE_DIR") or os.path.join(
+        tempfile.gettempdir(), "profiles")
+    profiler = RequestProfiler(
+        float(os.getenv("METRICS_PROFILE_RATE", 0)), directory)
+    if profiler.rate > 0:
+        os.makedirs(directory, exist_ok=True)
+    registry.gauge("profiled_requests", lambda: profiler.profiled,
+                   "Requests profiled with cProfile")
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.request_profiler = profiler.start()
+
+    @app.after_request
+    def record_duration(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            rule = request.url_rule
+            registry.observe("http_request_duration_seconds",
+                             time.perf_counter() - start,
+                             route=rule.rule if rule else "unmatched",
+                             method=request.method,
+                             status=str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exception=None):
+        started = g.pop("request_profiler", None)
+        if started is not None:
+            rule = request.url_rule
+            profiler.stop(started, "{} {}".format(
+                request.method, rule.rule if rule else "unmatched"))
+
+    def metrics():
+        if guard is not None:
+            guard()
+        return Response(registry.render(), content_type="text/plain; "
+                        "version=0.0.4; charset=utf-8")
+
+    app.add_url_rule(path, "metrics", metrics, methods=["GET"],
+                     strict_slashes=False)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Session stores caching the user of a session id
+"""
+from typing import Optional
+import os
+import threading
+import time
+
+from user import User
+
+
+class NullSessionStore:
+    """Session store caching nothing: every lookup goes to the database
+    """
+
+    verify = False
+
+    def get(self, session_id: str) -> Optional[User]:
+        """Return the cached user of a session"""
+        return None
+
+    def set(self, session_id: str, user: User) -> None:
+        """Cache the user of a session"""
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session"""
+
+
+class MemorySessionStore(NullSessionStore):
+    """In-process session store sharded across several locked dicts.
+
+    Entries expire ttl seconds after they are set, reads never extend
+    them, and are purged by a background sweeper. The users table stays
+    the source of truth: a logout handled by another process is only
+    seen once the entry expires, unless verify is set, in which case
+    Auth checks the session id of every cached user against the table.
+    """
+
+    def __init__(self, shards: int = 16, ttl: float = 60,
+                 sweep_interval: float = 60, verify: bool = False) -> None:
+        """Initialize the store and start the sweeper"""
+        self.ttl = ttl
+        self.verify = verify
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._sweeper = threading.Thread(target=self._sweep,
+                                         args=(sweep_interval,),
+                                         name="session-sweeper",
+                                         daemon=True)
+        self._sweeper.start()
+
+    def _shard(self, session_id: str):
+        """Return the (entries, lock) shard of a session id"""
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def get(self, session_id: str) -> Optional[User]:
+        """Return the cached user of a session, None if absent or expired
+        """
+        entries, lock = self._shard(session_id)
+        now = time.monotonic()
+        with lock:
+            entry = entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[1] < now:
+                del entries[session_id]
+                return None
+            return entry[0]
+
+    def set(self, session_id: str, user: User) -> None:
+        """Cache a detached copy of the user of a session"""
+        snapshot = User(id=user.id, email=user.email, session_id=session_id)
+        entries, lock = self._shard(session_id)
+        with lock:
+            entries[session_id] = (snapshot, time.monotonic() + self.ttl)
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session"""
+        entries, lock = self._shard(session_id)
+        with lock:
+            entries.pop(session_id, None)
+
+    def __len__(self) -> int:
+        """Number of cached sessions"""
+        return sum(len(entries) for entries, _ in self._shards)
+
+    def purge(self) -> None:
+        """Remove expired entries"""
+        now = time.monotonic()
+        for entries, lock in self._shards:
+            with lock:
+                expired = [session_id for session_id, entry
+                           in entries.items() if entry[1] < now]
+                for session_id in expired:
+                    del entries[session_id]
+
+    def _sweep(self, interval: float) -> None:
+        """Sweeper thread: purge expired entries every interval seconds"""
+        while True:
+            time.sleep(interval)
+            self.purge()
+
+
+def session_store_from_env() -> NullSessionStore:
+    """Build the session store configured by SESSION_STORE ("memory",
+    default, or "none"), SESSION_TTL, SESSION_SHARDS and SESSION_VERIFY
+    """
+    if os.getenv("SESSION_STORE", "memory") == "none":
+        return NullSessionStore()
+    return MemorySessionStore(int(os.getenv("SESSION_SHARDS", 16)),
+                              float(os.getenv("SESSION_TTL", 60)),
+                              verify=os.getenv("SESSION_VERIFY") == "1")
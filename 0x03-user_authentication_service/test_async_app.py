@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Tests of the ASGI app
+"""
+import asyncio
+import unittest
+from unittest import mock
+
+import async_app
+
+
+def request(body_chunks, path: str = "/sessions", method: str = "POST"):
+    """Run one HTTP request through the app
+    Return:
+        the status and the number of body chunks read by the app
+    """
+    messages = [{"type": "http.request", "body": chunk,
+                 "more_body": i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path,
+             "headers": []}
+    total = len(messages)
+    asyncio.run(async_app.app(scope, receive, send))
+    return sent[0]["status"], total - len(messages)
+
+
+class TestBodySize(unittest.TestCase):
+    """MAX_CONTENT_LENGTH"""
+
+    def test_too_large(self):
+        """Bodies over the limit get 413 before they are read entirely"""
+        with mock.patch.object(async_app, "MAX_CONTENT_LENGTH", 10):
+            status, read = request([b"x" * 8, b"x" * 8, b"x" * 8])
+        self.assertEqual(status, 413)
+        self.assertEqual(read, 2)
+
+    def test_within_limit(self):
+        """Bodies under the limit reach the routes"""
+        with mock.patch.object(async_app, "MAX_CONTENT_LENGTH", 10):
+            status, read = request([b"a=1", b"&b=2"], path="/nowhere")
+        self.assertEqual(status, 404)
+        self.assertEqual(read, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
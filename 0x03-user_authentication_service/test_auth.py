@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Tests of the Auth class
+"""
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from sqlalchemy import event
+
+from auth import Auth
+from test_bulk import patch_policy
+
+
+class SessionsTestCase(unittest.TestCase):
+    """Two Auth instances sharing one database, as two worker processes
+    would, with SESSION_VERIFY set to verify
+    """
+
+    verify = "0"
+
+    def setUp(self):
+        """Create a database file shared by two Auth instances"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "AUTH_DB_URL": "sqlite:///" + os.path.join(directory.name,
+                                                       "a.db"),
+            "AUTH_DB_MODE": "production",
+            "BCRYPT_EXECUTOR": "thread",
+            "SESSION_STORE": "memory",
+            "SESSION_VERIFY": self.verify})
+        env.start()
+        self.addCleanup(env.stop)
+        patch_policy(self)
+        self.first, self.second = Auth(), Auth()
+        self.first.register_user("bob@example.com", "pwd")
+
+
+class TestVerifiedSessions(SessionsTestCase):
+    """SESSION_VERIFY=1: cached sessions are checked on every hit"""
+
+    verify = "1"
+
+    def test_logout_seen_by_other_instance(self):
+        """A session ended by one instance is rejected by the other"""
+        session_id = self.first.create_session("bob@example.com")
+        user = self.second.get_user_from_session_id(session_id)
+        self.assertEqual(user.email, "bob@example.com")
+        self.first.destroy_session(user.id)
+        self.assertIsNone(self.second.get_user_from_session_id(session_id))
+
+    def test_new_login_seen_by_other_instance(self):
+        """A session replaced by one instance is rejected by the other"""
+        old = self.first.create_session("bob@example.com")
+        self.assertIsNotNone(self.second.get_user_from_session_id(old))
+        new = self.first.create_session("bob@example.com")
+        self.assertIsNone(self.second.get_user_from_session_id(old))
+        self.assertIsNotNone(self.second.get_user_from_session_id(new))
+
+
+class TestCachedSessions(SessionsTestCase):
+    """Default: cached sessions are trusted until they expire"""
+
+    def test_logout_seen_after_expiry(self):
+        """The other instance sees a logout once its entry expired"""
+        session_id = self.first.create_session("bob@example.com")
+        user = self.second.get_user_from_session_id(session_id)
+        self.first.destroy_session(user.id)
+        self.assertIsNotNone(self.second.get_user_from_session_id(session_id))
+        later = time.monotonic() + self.second._sessions.ttl + 1
+        with mock.patch("session_store.time.monotonic", return_value=later):
+            self.assertIsNone(
+                self.second.get_user_from_session_id(session_id))
+
+    def test_cached_lookups_skip_the_database(self):
+        """Lookups of a cached session run no SQL statement"""
+        session_id = self.first.create_session("bob@example.com")
+        self.second.get_user_from_session_id(session_id)
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.second._db._engine
+        event.listen(engine, "before_cursor_execute", count)
+        self.addCleanup(event.remove, engine, "before_cursor_execute", count)
+        for _ in range(10):
+            user = self.second.get_user_from_session_id(session_id)
+            self.assertEqual(user.email, "bob@example.com")
+        self.assertEqual(statements, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
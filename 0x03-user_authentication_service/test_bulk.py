@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Tests of the bulk import of users
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from auth import Auth, _hash_password
+from bcrypt_executor import BcryptExecutor
+from password_policy import BcryptPolicy
+
+
+def patch_policy(test: unittest.TestCase) -> None:
+    """Hash with the lowest cost during a test"""
+    for target in ("auth.POLICY", "bulk.POLICY"):
+        policy = mock.patch(target, BcryptPolicy(rounds=4))
+        policy.start()
+        test.addCleanup(policy.stop)
+
+
+class TestImport(unittest.TestCase):
+    """Imports through Auth.import_users"""
+
+    def setUp(self):
+        """Create an Auth instance on a temporary database"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "AUTH_DB_URL": "sqlite:///" + os.path.join(directory.name,
+                                                       "a.db"),
+            "BCRYPT_EXECUTOR": "thread",
+            "BCRYPT_WORKERS": "2"})
+        env.start()
+        self.addCleanup(env.stop)
+        patch_policy(self)
+        self.auth = Auth()
+
+    def test_hashes_go_through_the_executor(self):
+        """Imported passwords are hashed by the bcrypt executor"""
+        records = [{"email": "user{}@example.com".format(i),
+                    "password": "pwd"} for i in range(5)]
+        counts = self.auth.import_users(records)
+        self.assertEqual(counts["inserted"], 5)
+        self.assertEqual(self.auth.bcrypt_stats()["completed"], 5)
+        self.assertTrue(self.auth.valid_login("user3@example.com", "pwd"))
+
+
+class TestImportEndpoint(unittest.TestCase):
+    """POST /admin/users/import with malformed records"""
+
+    def setUp(self):
+        """Point the app at a temporary database"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "AUTH_DB_URL": "sqlite:///" + os.path.join(directory.name,
+                                                       "a.db"),
+            "ADMIN_TOKEN": "secret",
+            "BCRYPT_EXECUTOR": "thread"})
+        env.start()
+        self.addCleanup(env.stop)
+        patch_policy(self)
+        import app
+        auth = mock.patch.object(app, "AUTH", Auth())
+        auth.start()
+        self.addCleanup(auth.stop)
+        self.client = app.app.test_client()
+
+    def post(self, body: bytes):
+        """Import body as NDJSON"""
+        return self.client.post("/admin/users/import", data=body,
+                                headers={"X-Admin-Token": "secret"})
+
+    def test_invalid_records(self):
+        """Non-objects, bad JSON and mistyped fields are invalid"""
+        response = self.post(b"\n".join([
+            b'{"email": "a@example.com", "password": "pwd"}',
+            b'[1, 2]',
+            b'"text"',
+            b'{"email": "b@example.com", "hashed_password": 12}',
+            b'{"email": ["c@example.com"], "password": "pwd"}',
+            b'{"email": "d@example.com", "password": 5}',
+            b'{not json',
+            b'{"email": "e@example.com", "password": "pwd"}']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"read": 8, "inserted": 2,
+                                         "skipped": 0, "invalid": 6})
+
+    def test_undecodable_body(self):
+        """Records read before a decoding error are inserted"""
+        hashed = _hash_password("pwd", 4).decode()
+        lines = ['{{"email": "user{}@example.com", "hashed_password": '
+                 '"{}"}}'.format(i, hashed) for i in range(1500)]
+        response = self.post("\n".join(lines).encode() + b"\n\xff\xfe\n")
+        self.assertEqual(response.status_code, 200)
+        # the body is decoded by chunks: the records before the chunk
+        # holding the bad bytes are inserted
+        self.assertGreaterEqual(response.json["inserted"], 1000)
+        self.assertLess(response.json["inserted"], 1500)
+        self.assertIn("error", response.json)
+
+
+class TestExecutorMap(unittest.TestCase):
+    """BcryptExecutor.map"""
+
+    def test_bounded_concurrency(self):
+        """At most concurrency calls are pending, results keep order"""
+        executor = BcryptExecutor("thread", 4, 8)
+        self.addCleanup(executor.shutdown)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def call(value):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return value * 2
+
+        results = list(executor.map(call, range(20), concurrency=2))
+        self.assertEqual(results, [value * 2 for value in range(20)])
+        self.assertLessEqual(running[1], 2)
+        self.assertEqual(executor.stats()["completed"], 20)
+        self.assertEqual(executor.stats()["pending"], 0)
+
+    def test_hash_password(self):
+        """Process pools receive the hashing function"""
+        executor = BcryptExecutor("process", 2)
+        self.addCleanup(executor.shutdown)
+        hashes = list(executor.map(_hash_password, ["a", "b"], [4, 4]))
+        self.assertTrue(all(h.startswith(b"$2b$04$") for h in hashes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Tests of the DB class
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy.exc import IntegrityError
+
+from db import DB
+
+# users table as created before the indexes were added
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    email VARCHAR(250) NOT NULL,
+    hashed_password VARCHAR(250) NOT NULL,
+    session_id VARCHAR(250),
+    reset_token VARCHAR(250),
+    PRIMARY KEY (id)
+)
+"""
+
+
+class TestProductionUpgrade(unittest.TestCase):
+    """Production mode on a users table of the baseline schema"""
+
+    def setUp(self):
+        """Create a baseline users table"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "a.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(BASELINE_SCHEMA)
+
+    def insert(self, *emails: str) -> None:
+        """Insert users directly in the table"""
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany(
+                "INSERT INTO users (email, hashed_password) VALUES (?, ?)",
+                [(email, "$2b$04$x") for email in emails])
+
+    def test_indexes_created(self):
+        """The missing indexes are created and reject duplicates"""
+        self.insert("bob@example.com")
+        db = DB("sqlite:///" + self.path, production=True)
+        with sqlite3.connect(self.path) as connection:
+            indexes = {row[0] for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertLessEqual({"ix_users_email", "ix_users_session_id",
+                              "ix_users_reset_token"}, indexes)
+        with self.assertRaises(IntegrityError):
+            db.add_user("bob@example.com", "$2b$04$y")
+        self.assertEqual(db.find_user_by(email="bob@example.com").id, 1)
+
+    def test_duplicates_fail_startup(self):
+        """Existing duplicate emails are reported at startup"""
+        self.insert("bob@example.com", "bob@example.com")
+        with self.assertRaisesRegex(RuntimeError, "bob@example.com"):
+            DB("sqlite:///" + self.path, production=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Tests of the access to the metrics routes
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from auth import Auth
+from test_bulk import patch_policy
+
+
+class TestFlaskMetrics(unittest.TestCase):
+    """GET /metrics and /metrics/bcrypt of the Flask app"""
+
+    def setUp(self):
+        """Point the app at a temporary database"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "AUTH_DB_URL": "sqlite:///" + os.path.join(directory.name,
+                                                       "a.db"),
+            "ADMIN_TOKEN": "secret",
+            "BCRYPT_EXECUTOR": "thread"})
+        env.start()
+        self.addCleanup(env.stop)
+        os.environ.pop("METRICS_PUBLIC", None)
+        patch_policy(self)
+        import app
+        auth = mock.patch.object(app, "AUTH", Auth())
+        auth.start()
+        self.addCleanup(auth.stop)
+        self.client = app.app.test_client()
+
+    def statuses(self, **headers):
+        """Statuses of both metrics routes"""
+        return [self.client.get(path, headers=headers).status_code
+                for path in ("/metrics", "/metrics/bcrypt")]
+
+    def test_admin_only(self):
+        """Metrics require the admin token"""
+        self.assertEqual(self.statuses(), [403, 403])
+        self.assertEqual(self.statuses(**{"X-Admin-Token": "wrong"}),
+                         [403, 403])
+        self.assertEqual(self.statuses(**{"X-Admin-Token": "secret"}),
+                         [200, 200])
+
+    def test_public(self):
+        """METRICS_PUBLIC=1 serves them without the token"""
+        with mock.patch.dict(os.environ, {"METRICS_PUBLIC": "1"}):
+            self.assertEqual(self.statuses(), [200, 200])
+
+
+class TestAsyncMetrics(unittest.TestCase):
+    """GET /metrics/bcrypt of the ASGI app"""
+
+    def status(self, headers=()):
+        """Status of GET /metrics/bcrypt"""
+        import async_app
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/metrics/bcrypt",
+                 "headers": list(headers)}
+        asyncio.run(async_app.app(scope, receive, send))
+        return sent[0]["status"]
+
+    def test_admin_only(self):
+        """The route requires the admin token unless METRICS_PUBLIC=1"""
+        with mock.patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            os.environ.pop("METRICS_PUBLIC", None)
+            self.assertEqual(self.status(), 403)
+            self.assertEqual(self.status([(b"x-admin-token", b"wrong")]), 403)
+            self.assertEqual(self.status([(b"X-Admin-Token", b"secret")]),
+                             200)
+            os.environ["METRICS_PUBLIC"] = "1"
+            self.assertEqual(self.status(), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Tests of the bcrypt cost policy
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import bcrypt
+
+from password_policy import BcryptPolicy
+
+
+class TestPolicy(unittest.TestCase):
+    """BcryptPolicy"""
+
+    def test_rehash_upward_only(self):
+        """Only hashes with a lower cost than the policy's are rehashed"""
+        policy = BcryptPolicy(rounds=5)
+        for rounds, expected in ((4, True), (5, False), (6, False)):
+            hashed = bcrypt.hashpw(b"pwd", bcrypt.gensalt(rounds))
+            self.assertEqual(policy.needs_rehash(hashed), expected)
+
+    def test_rounds_file(self):
+        """The first calibration is stored and reused"""
+        with tempfile.TemporaryDirectory() as directory:
+            rounds_file = os.path.join(directory, "rounds")
+            first = BcryptPolicy(min_rounds=4, max_rounds=31,
+                                 rounds_file=rounds_file)
+            with mock.patch.object(first, "calibrate", return_value=7):
+                self.assertEqual(first.rounds(), 7)
+            second = BcryptPolicy(rounds_file=rounds_file)
+            with mock.patch.object(second, "calibrate") as calibrate:
+                self.assertEqual(second.rounds(), 7)
+            calibrate.assert_not_called()
+            self.assertEqual(os.listdir(directory), ["rounds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@
 """
 This module contains the SQLAlchemy model for the User.
 """
-from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy import Column, Index, Integer, String, create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -14,15 +14,24 @@ class User(Base):
 
     Attributes:
     id (int): The integer primary key.
-    email (str): The user's email (non-nullable).
+    email (str): The user's email (non-nullable, unique).
     hashed_password (str): The hashed password (non-nullable).
     session_id (str): The session ID (nullable).
     reset_token (str): The reset token (nullable).
     """
     __tablename__ = "users"
+    # most users have no session nor reset token: only index the others
+    __table_args__ = (
+        Index("ix_users_session_id", "session_id",
+              sqlite_where=text("session_id IS NOT NULL"),
+              postgresql_where=text("session_id IS NOT NULL")),
+        Index("ix_users_reset_token", "reset_token",
+              sqlite_where=text("reset_token IS NOT NULL"),
+              postgresql_where=text("reset_token IS NOT NULL")),
+    )
 
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), nullable=False)
+    email = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
     session_id = Column(String(250), nullable=True)
     reset_token = Column(String(250), nullable=True)